@@ -1,23 +1,58 @@
 # articles.py
-from fastapi import APIRouter, HTTPException
-import json
+from fastapi import APIRouter, HTTPException, Query, Request
 import os
 
+from jsoncollection import JsonCollection, RenderedJson, cached_response
+from metrics import span
+from registry import registry
+from search import CollectionSearch
+
 router = APIRouter()
 
 ARTICLES_PATH = os.path.join(os.path.dirname(__file__), "articles.json")
 
-# Load articles once
-with open(ARTICLES_PATH, "r", encoding="utf-8") as f:
-    articles = json.load(f)
+# Loaded once, on first use; picked up again when the file changes
+registry.register("articles", lambda: JsonCollection(ARTICLES_PATH))
+registry.register("article_search", lambda: CollectionSearch(
+    registry.get("articles"), {"title": 3.0, "content": 1.0}
+))
+
+def get_articles():
+    return registry.get("articles").refresh()
+
+# Responses are serialized once per version of articles.json
+def _render_list(items, by_id):
+    return RenderedJson([{"id": a["id"], "title": a["title"]} for a in items])
+
+def _render_details(items, by_id):
+    return {article_id: RenderedJson(article) for article_id, article in by_id.items()}
 
 @router.get("/articles")
-def list_articles():
-    return [{"id": a["id"], "title": a["title"]} for a in articles]
+def list_articles(request: Request):
+    return cached_response(request, get_articles().derived("list", _render_list))
+
+@router.get("/articles/search")
+def search_articles(
+    q: str = Query(..., min_length=1),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    with span("search", collection="articles"):
+        total, hits = registry.get("article_search").search(q, offset, limit)
+    return {
+        "query": q,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": [
+            {"id": a["id"], "title": a["title"], "score": round(score, 4)}
+            for a, score in hits
+        ]
+    }
 
 @router.get("/articles/{article_id}")
-def get_article(article_id: int):
-    for article in articles:
-        if article["id"] == article_id:
-            return article
-    raise HTTPException(status_code=404, detail="Article not found")
+def get_article(article_id: int, request: Request):
+    rendered = get_articles().derived("details", _render_details).get(article_id)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Article not found")
+    return cached_response(request, rendered)
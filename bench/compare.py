@@ -0,0 +1,66 @@
+# Diff two bench.run result files:
+#
+#   python -m bench.compare before.json after.json [--threshold 0.10]
+#
+# Prints the relative change of every latency percentile and throughput per
+# scale/endpoint and exits with status 1 if anything got worse than the
+# threshold.
+import argparse
+import json
+import sys
+
+# metric -> True when lower is better
+METRICS = {
+    "p50_ms": True,
+    "p95_ms": True,
+    "p99_ms": True,
+    "throughput_rps": False,
+    "peak_rss_mb": True,
+}
+
+
+def compare(before, after, threshold):
+    rows = []
+    for scale in sorted(set(before["scales"]) & set(after["scales"]), key=int):
+        old_scale, new_scale = before["scales"][scale], after["scales"][scale]
+        endpoints = {"(total)": (old_scale["total"], new_scale["total"])}
+        for name in sorted(set(old_scale["endpoints"]) & set(new_scale["endpoints"])):
+            endpoints[name] = (old_scale["endpoints"][name], new_scale["endpoints"][name])
+
+        for name, (old, new) in endpoints.items():
+            for metric, lower_is_better in METRICS.items():
+                a, b = old.get(metric), new.get(metric)
+                if not a or b is None:
+                    continue
+                change = (b - a) / a
+                worse = change > threshold if lower_is_better else change < -threshold
+                rows.append((scale, name, metric, a, b, change, worse))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("before")
+    parser.add_argument("after")
+    parser.add_argument("--threshold", type=float, default=0.10, help="relative change counted as a regression")
+    args = parser.parse_args()
+
+    with open(args.before, "r", encoding="utf-8") as f:
+        before = json.load(f)
+    with open(args.after, "r", encoding="utf-8") as f:
+        after = json.load(f)
+
+    rows = compare(before, after, args.threshold)
+    print(f"{before.get('commit')} -> {after.get('commit')}")
+    print(f"{'scale':>6} {'endpoint':<24}{'metric':<16}{'before':>12}{'after':>12}{'change':>10}")
+    for scale, name, metric, a, b, change, worse in rows:
+        flag = "  REGRESSION" if worse else ""
+        print(f"{scale + 'x':>6} {name:<24}{metric:<16}{a:>12}{b:>12}{change:>+10.1%}{flag}")
+
+    regressions = [row for row in rows if row[-1]]
+    print(f"\n{len(regressions)} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
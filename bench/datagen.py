@@ -0,0 +1,104 @@
+# Builds a scaled copy of the app for benchmarking: the code and models are
+# copied as-is, while nepalifood.csv, both profile files and the meal log are
+# replicated / generated `factor` times over. Base records keep their ids, so
+# recorded traffic stays valid at every scale.
+import csv
+import json
+import os
+import random
+import shutil
+import uuid
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+NUTRIENT_COLUMNS = [
+    "calories", "protein", "fat", "carbs", "iron", "calcium",
+    "vitaminA", "vitaminC", "folate"
+]
+
+MEALS_PER_SCALE = 200      # meal log entries at 1x
+MEAL_DAYS = 30             # spread over 2025-07-01 .. 2025-07-30
+
+# Runtime state of a running app; generated fresh for every copy
+_SKIP = {
+    "__pycache__", ".git", "bench", "requests.jsonl",
+    "logged_meals.jsonl", "logged_meals.totals.json", "sperm_scores.json",
+}
+
+
+def _ignore(directory, names):
+    return [n for n in names if n in _SKIP or n.endswith((".journal", ".tmp"))]
+
+
+def copy_app(src_dir, dst_dir):
+    shutil.copytree(src_dir, dst_dir, ignore=_ignore, dirs_exist_ok=True)
+
+
+def scale_foods(dst_dir, factor, rng):
+    path = os.path.join(dst_dir, "nepalifood.csv")
+    with open(path, newline="", encoding="utf-8") as f:
+        reader = csv.DictReader(f)
+        fields = reader.fieldnames
+        rows = list(reader)
+
+    stride = max(int(r["food_id"]) for r in rows) + 1
+    with open(path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=fields)
+        writer.writeheader()
+        for k in range(factor):
+            for row in rows:
+                if k:
+                    # Copies get new ids/names and +-10% nutrient noise so
+                    # rankings don't collapse into ties
+                    row = dict(row)
+                    row["food_id"] = k * stride + int(row["food_id"])
+                    row["food_name"] = f"{row['food_name']} #{k}"
+                    for column in NUTRIENT_COLUMNS:
+                        if row.get(column) not in (None, ""):
+                            row[column] = round(float(row[column]) * rng.uniform(0.9, 1.1), 2)
+                writer.writerow(row)
+
+
+def scale_profiles(dst_dir, filename, factor):
+    path = os.path.join(dst_dir, filename)
+    with open(path, "r", encoding="utf-8") as f:
+        profiles = json.load(f)
+    scaled = []
+    for k in range(factor):
+        for profile in profiles:
+            if k:
+                profile = {**profile, "user_id": f"{profile['user_id']}_{k}"}
+            scaled.append(profile)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(scaled, f)
+
+
+def generate_meals(dst_dir, count, rng):
+    with open(os.path.join(dst_dir, "nepalifood.csv"), newline="", encoding="utf-8") as f:
+        foods = list(csv.DictReader(f))
+    with open(os.path.join(dst_dir, "user_profiles.json"), "r", encoding="utf-8") as f:
+        user_ids = [p["user_id"] for p in json.load(f)]
+
+    with open(os.path.join(dst_dir, "logged_meals.jsonl"), "w", encoding="utf-8") as f:
+        for _ in range(count):
+            food = rng.choice(foods)
+            nutrients = {c: float(food[c] or 0) for c in NUTRIENT_COLUMNS}
+            nutrients["iodine"] = 0.0
+            f.write(json.dumps({
+                "entry_id": uuid.UUID(int=rng.getrandbits(128)).hex,
+                "user_id": rng.choice(user_ids),
+                "food_id": int(food["food_id"]),
+                "food_name": food["food_name"],
+                "date": f"2025-07-{rng.randint(1, MEAL_DAYS):02d}",
+                "nutrients": nutrients,
+            }) + "\n")
+
+
+def build_dataset(dst_dir, factor, seed=0, src_dir=REPO_DIR):
+    rng = random.Random(seed)
+    copy_app(src_dir, dst_dir)
+    scale_foods(dst_dir, factor, rng)
+    scale_profiles(dst_dir, "user_profiles.json", factor)
+    scale_profiles(dst_dir, "user_profiles_no_score.json", factor)
+    generate_meals(dst_dir, MEALS_PER_SCALE * factor, rng)
+    return dst_dir
@@ -0,0 +1,111 @@
+# Benchmark driver.
+#
+#   python -m bench.run --scales 1 10 100 --requests 2000 --out bench/results.json
+#   python -m bench.run --replay traffic.jsonl --out after.json
+#   python -m bench.compare before.json after.json
+#
+# For every scale factor a scaled copy of the app is built in a temp dir
+# (bench.datagen), a request mix is generated for it (or --replay is used),
+# and bench.worker replays it in a fresh subprocess.
+import argparse
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench.datagen import REPO_DIR, build_dataset
+from bench.workload import load_requests, save_requests, synthetic_requests
+
+WORKER = os.path.join(os.path.dirname(os.path.abspath(__file__)), "worker.py")
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=REPO_DIR, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_scale(scale, args):
+    app_dir = tempfile.mkdtemp(prefix=f"mamacare-bench-{scale}x-")
+    try:
+        started = time.perf_counter()
+        build_dataset(app_dir, scale, seed=args.seed)
+        build_seconds = time.perf_counter() - started
+
+        if args.replay:
+            requests = load_requests(args.replay)
+        else:
+            requests = synthetic_requests(app_dir, args.requests, seed=args.seed)
+        requests_path = os.path.join(app_dir, "bench_requests.jsonl")
+        save_requests(requests_path, requests)
+        if args.save_requests:
+            save_requests(f"{args.save_requests}.{scale}x.jsonl", requests)
+
+        out_path = os.path.join(app_dir, "bench_result.json")
+        subprocess.run(
+            [sys.executable, WORKER, "--app-dir", app_dir, "--requests", requests_path,
+             "--out", out_path, "--warmup", str(args.warmup)],
+            check=True,
+        )
+        with open(out_path, "r", encoding="utf-8") as f:
+            result = json.load(f)
+        result["dataset_build_seconds"] = round(build_seconds, 3)
+        return result
+    finally:
+        if args.keep:
+            print(f"kept {app_dir}", file=sys.stderr)
+        else:
+            shutil.rmtree(app_dir, ignore_errors=True)
+
+
+def print_summary(results):
+    for scale, result in results["scales"].items():
+        total = result["total"]
+        print(f"\n== {scale}x: {total['count']} requests, {total['throughput_rps']} req/s, "
+              f"peak RSS {result['peak_rss_mb']} MB")
+        print(f"{'endpoint':<24}{'count':>7}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>10}{'5xx':>6}")
+        for name, stats in result["endpoints"].items():
+            print(f"{name:<24}{stats['count']:>7}{stats['p50_ms']:>10}{stats['p95_ms']:>10}"
+                  f"{stats['p99_ms']:>10}{stats['throughput_rps']:>10}{stats['errors']:>6}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay request mixes against scaled copies of the app")
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--requests", type=int, default=2000, help="size of the synthetic mix")
+    parser.add_argument("--replay", help="JSON Lines request file to replay instead of a synthetic mix")
+    parser.add_argument("--save-requests", help="write each generated mix to <path>.<scale>x.jsonl")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--warmup", type=int, default=3)
+    parser.add_argument("--keep", action="store_true", help="keep the generated app copies")
+    parser.add_argument("--out", help="write results as JSON (input for bench.compare)")
+    args = parser.parse_args()
+
+    results = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "replay": args.replay,
+        "scales": {},
+    }
+    for scale in args.scales:
+        results["scales"][str(scale)] = run_scale(scale, args)
+
+    print_summary(results)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+# Replays one request file against the app in --app-dir, in-process through
+# FastAPI's TestClient (lifespan included), and writes per-endpoint stats as
+# JSON. Run by bench.run in a fresh subprocess per dataset so imports, caches
+# and peak RSS are measured from a cold start.
+import argparse
+import json
+import os
+import resource
+import sys
+import time
+
+import numpy as np
+
+PAGE_SIZE = os.sysconf("SC_PAGE_SIZE") if hasattr(os, "sysconf") else 4096
+
+
+def current_rss_mb():
+    try:
+        with open("/proc/self/statm", "r") as f:
+            return int(f.read().split()[1]) * PAGE_SIZE / 2**20
+    except OSError:
+        return peak_rss_mb()
+
+
+def peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, bytes on macOS
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+def summarize(latencies, statuses, rss):
+    latencies = np.array(latencies) * 1000
+    return {
+        "count": len(latencies),
+        "errors": sum(count for status, count in statuses.items() if int(status) >= 500),
+        "statuses": statuses,
+        "mean_ms": round(float(latencies.mean()), 3),
+        "p50_ms": round(float(np.percentile(latencies, 50)), 3),
+        "p95_ms": round(float(np.percentile(latencies, 95)), 3),
+        "p99_ms": round(float(np.percentile(latencies, 99)), 3),
+        # requests per second of time spent serving this endpoint
+        "throughput_rps": round(len(latencies) / (latencies.sum() / 1000), 2) if latencies.sum() else None,
+        "peak_rss_mb": round(rss, 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--app-dir", required=True)
+    parser.add_argument("--requests", required=True)
+    parser.add_argument("--out", required=True)
+    parser.add_argument("--warmup", type=int, default=3, help="unmeasured calls per endpoint first")
+    args = parser.parse_args()
+
+    app_dir = os.path.abspath(args.app_dir)
+    os.chdir(app_dir)
+    sys.path.insert(0, app_dir)
+    sys.path.insert(1, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+    from bench.workload import load_requests
+    requests = load_requests(args.requests)
+
+    rss_start = current_rss_mb()
+    started = time.perf_counter()
+    import main as app_module
+    from fastapi.testclient import TestClient
+    import_seconds = time.perf_counter() - started
+
+    latencies = {}
+    statuses = {}
+    rss = {}
+    with TestClient(app_module.app, raise_server_exceptions=False) as client:
+        def send(r):
+            return client.request(r["method"], r["path"], params=r.get("params"), json=r.get("json"))
+
+        # First-use loads (models, catalog, indexes) are reported separately
+        first = {}
+        for r in requests:
+            if r["endpoint"] not in first:
+                t = time.perf_counter()
+                send(r)
+                first[r["endpoint"]] = round((time.perf_counter() - t) * 1000, 3)
+                for _ in range(args.warmup - 1):
+                    send(r)
+
+        started = time.perf_counter()
+        for r in requests:
+            t = time.perf_counter()
+            response = send(r)
+            elapsed = time.perf_counter() - t
+            name = r["endpoint"]
+            latencies.setdefault(name, []).append(elapsed)
+            endpoint_statuses = statuses.setdefault(name, {})
+            status = str(response.status_code)
+            endpoint_statuses[status] = endpoint_statuses.get(status, 0) + 1
+            rss[name] = max(rss.get(name, 0), current_rss_mb())
+        total_seconds = time.perf_counter() - started
+
+    all_latencies = [t for values in latencies.values() for t in values]
+    all_statuses = {}
+    for endpoint_statuses in statuses.values():
+        for status, count in endpoint_statuses.items():
+            all_statuses[status] = all_statuses.get(status, 0) + count
+
+    result = {
+        "requests": len(requests),
+        "import_seconds": round(import_seconds, 4),
+        "first_call_ms": first,
+        "rss_start_mb": round(rss_start, 1),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "total": {
+            **summarize(all_latencies, all_statuses, max(rss.values(), default=0)),
+            "seconds": round(total_seconds, 4),
+            "throughput_rps": round(len(all_latencies) / total_seconds, 2) if total_seconds else None,
+        },
+        "endpoints": {
+            name: summarize(latencies[name], statuses[name], rss[name])
+            for name in sorted(latencies)
+        },
+    }
+    with open(args.out, "w", encoding="utf-8") as f:
+        json.dump(result, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
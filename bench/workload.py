@@ -0,0 +1,105 @@
+# Request mixes for the benchmark. A request is a dict
+#   {"endpoint", "method", "path", "params", "json"}
+# and a mix is a list of them, stored as JSON Lines so the exact same
+# traffic can be replayed against another release.
+import csv
+import json
+import os
+import random
+
+# Relative weights of the synthetic mix
+DEFAULT_MIX = {
+    "recommend": 10,
+    "foodrecommendation": 15,
+    "nutrientsummary": 20,
+    "logmeal": 20,
+    "predict_complication": 15,
+    "sperm_recommendation": 10,
+    "recipes_search": 10,
+}
+
+SEARCH_TERMS = ["dal", "momo", "mom", "bhat", "dumplings", "rice", "spinch", "snack"]
+SYMPTOM_FIELDS = [
+    "bleeding", "pain", "vomiting", "swelling", "headache",
+    "dizziness", "fatigue", "temperature", "urine_color", "fetal_movement"
+]
+INT_FIELDS = {"swelling", "headache", "dizziness", "fatigue"}
+
+
+def _load(app_dir):
+    with open(os.path.join(app_dir, "nepalifood.csv"), newline="", encoding="utf-8") as f:
+        foods = list(csv.DictReader(f))
+    with open(os.path.join(app_dir, "user_profiles.json"), "r", encoding="utf-8") as f:
+        maternal = json.load(f)
+    with open(os.path.join(app_dir, "user_profiles_no_score.json"), "r", encoding="utf-8") as f:
+        men = [p["user_id"] for p in json.load(f)]
+    with open(os.path.join(app_dir, "pregnancy_symptom_dataset_sample.csv"), newline="", encoding="utf-8") as f:
+        symptoms = [
+            {k: int(row[k]) if k in INT_FIELDS else row[k] for k in SYMPTOM_FIELDS}
+            for row in csv.DictReader(f)
+        ]
+    return foods, maternal, men, symptoms
+
+
+def synthetic_requests(app_dir, count, seed=0, mix=DEFAULT_MIX):
+    foods, maternal, men, symptoms = _load(app_dir)
+    regions = sorted({f["region"] for f in foods if f["region"].lower() != "all"})
+    rng = random.Random(seed)
+    endpoints = list(mix)
+    weights = [mix[e] for e in endpoints]
+
+    def make(endpoint):
+        if endpoint == "recommend":
+            return "POST", "/recommend", None, {
+                "user_region": rng.choice(regions),
+                "food_names": [f["food_name"] for f in rng.sample(foods, 3)],
+                "top_n": 5,
+            }
+        if endpoint == "foodrecommendation":
+            return "GET", f"/foodrecommendation/{rng.choice(maternal)['user_id']}", {"top_n": 5}, None
+        if endpoint == "nutrientsummary":
+            user_id = rng.choice(maternal)["user_id"]
+            if rng.random() < 0.8:
+                return "GET", f"/nutrientsummary/{user_id}", {"date": f"2025-07-{rng.randint(1, 30):02d}"}, None
+            return "GET", f"/nutrientsummary/{user_id}", {"start": "2025-07-01", "end": "2025-07-30"}, None
+        if endpoint == "logmeal":
+            return "POST", "/logmeal", None, {
+                "user_id": rng.choice(maternal)["user_id"],
+                "food_id": int(rng.choice(foods)["food_id"]),
+                "date": f"2025-07-{rng.randint(1, 30):02d}",
+            }
+        if endpoint == "predict_complication":
+            return "POST", "/predict-complication", None, rng.choice(symptoms)
+        if endpoint == "sperm_recommendation":
+            return "POST", "/sperm-recommendation", None, {
+                "user_id": rng.choice(men),
+                "meals": [
+                    {"food_name": f["food_name"], "amount_grams": rng.choice([50, 100, 150, 200])}
+                    for f in rng.sample(foods, 3)
+                ],
+            }
+        if endpoint == "recipes_search":
+            return "GET", "/recipes/search", {"q": rng.choice(SEARCH_TERMS)}, None
+        raise ValueError(f"Unknown endpoint: {endpoint}")
+
+    requests = []
+    for endpoint in rng.choices(endpoints, weights, k=count):
+        method, path, params, body = make(endpoint)
+        requests.append({"endpoint": endpoint, "method": method, "path": path, "params": params, "json": body})
+    return requests
+
+
+def load_requests(path):
+    with open(path, "r", encoding="utf-8") as f:
+        requests = [json.loads(line) for line in f if line.strip()]
+    for r in requests:
+        r.setdefault("endpoint", f"{r['method']} {r['path']}")
+        r.setdefault("params", None)
+        r.setdefault("json", None)
+    return requests
+
+
+def save_requests(path, requests):
+    with open(path, "w", encoding="utf-8") as f:
+        for r in requests:
+            f.write(json.dumps(r) + "\n")
@@ -1,19 +1,111 @@
-import joblib
-import pandas as pd
+import json
+
+import numpy as np
+
+
+def compile_complication_model(model, label_encoders, target_encoder):
+    # Flattens a fitted DecisionTreeClassifier and its label encoders into
+    # plain lists, so serving needs neither joblib nor sklearn
+    tree = model.tree_
+    leaf_class = np.argmax(tree.value[:, 0, :], axis=1)
+    return {
+        "features": [str(f) for f in model.feature_names_in_],
+        "categories": {
+            col: [str(label) for label in encoder.classes_]
+            for col, encoder in label_encoders.items()
+        },
+        "conditions": [str(c) for c in target_encoder.inverse_transform(model.classes_)],
+        "nodes": {
+            "feature": tree.feature.tolist(),
+            "threshold": tree.threshold.tolist(),
+            "left": tree.children_left.tolist(),
+            "right": tree.children_right.tolist(),
+            "leaf_class": leaf_class.tolist(),
+        },
+        "max_depth": int(tree.max_depth),
+    }
+
+
+def export_compiled_model(path, model, label_encoders, target_encoder):
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(compile_complication_model(model, label_encoders, target_encoder), f)
+
 
 class ComplicationPredictor:
-    def __init__(self, model_path, encoder_path, target_encoder_path):
-        self.model = joblib.load(model_path)
-        self.encoders = joblib.load(encoder_path)
-        self.target_encoder = joblib.load(target_encoder_path)
+    def __init__(self, compiled_path):
+        with open(compiled_path, "r", encoding="utf-8") as f:
+            artifact = json.load(f)
 
-    def predict(self, symptoms: dict):
-        df = pd.DataFrame([symptoms])
+        # Column order the tree was trained on
+        self.features = artifact["features"]
+
+        # LabelEncoder.transform as plain dict lookups: label -> code
+        self.lookups = {
+            col: {label: code for code, label in enumerate(classes)}
+            for col, classes in artifact["categories"].items()
+        }
 
-        # Apply label encoders to categorical columns
-        for col in self.encoders:
-            df[col] = self.encoders[col].transform(df[col])
+        # Tree output index -> condition name
+        self.conditions = artifact["conditions"]
+        self.max_depth = artifact["max_depth"]
 
-        prediction = self.model.predict(df)[0]
-        condition = self.target_encoder.inverse_transform([prediction])[0]
-        return condition
+        # Flat node arrays; children are -1 at leaves. Lists for the
+        # single-row walk, NumPy copies for the vectorized batch walk.
+        nodes = artifact["nodes"]
+        self.feature = nodes["feature"]
+        self.threshold = nodes["threshold"]
+        self.left = nodes["left"]
+        self.right = nodes["right"]
+        self.leaf_class = nodes["leaf_class"]
+
+        self._feature = np.array(self.feature, dtype=np.intp)
+        self._threshold = np.array(self.threshold, dtype=np.float64)
+        self._left = np.array(self.left, dtype=np.intp)
+        self._right = np.array(self.right, dtype=np.intp)
+        self._leaf_class = np.array(self.leaf_class, dtype=np.intp)
+        self._conditions = np.array(self.conditions, dtype=object)
+
+    def encode_row(self, symptoms):
+        row = []
+        for col in self.features:
+            value = symptoms[col]
+            lookup = self.lookups.get(col)
+            if lookup is not None:
+                if value not in lookup:
+                    raise ValueError(f"Unknown value {value!r} for {col}")
+                value = lookup[value]
+            row.append(value)
+        return row
+
+    def encode(self, symptoms_list):
+        X = np.empty((len(symptoms_list), len(self.features)), dtype=np.float64)
+        for i, symptoms in enumerate(symptoms_list):
+            X[i] = self.encode_row(symptoms)
+        return X
+
+    def predict_batch(self, symptoms_list):
+        if not symptoms_list:
+            return []
+        X = self.encode(symptoms_list)
+
+        # Walk all rows down the tree together, one level per iteration
+        rows = np.arange(len(X))
+        node = np.zeros(len(X), dtype=np.intp)
+        for _ in range(self.max_depth):
+            internal = self._left[node] != -1
+            if not internal.any():
+                break
+            go_left = X[rows, self._feature[node]] <= self._threshold[node]
+            child = np.where(go_left, self._left[node], self._right[node])
+            node = np.where(internal, child, node)
+        return self._conditions[self._leaf_class[node]].tolist()
+
+    def predict(self, symptoms: dict):
+        row = self.encode_row(symptoms)
+        node = 0
+        while self.left[node] != -1:
+            if row[self.feature[node]] <= self.threshold[node]:
+                node = self.left[node]
+            else:
+                node = self.right[node]
+        return self.conditions[self.leaf_class[node]]
@@ -5,6 +5,8 @@ from sklearn.model_selection import train_test_split
 from sklearn.metrics import classification_report
 import joblib
 
+from complication_model import export_compiled_model
+
 # Load dataset
 df = pd.read_csv("pregnancy_symptom_dataset_sample.csv")
 
@@ -43,6 +45,9 @@ print(label_encoders["bleeding"].classes_)
 joblib.dump(model, "model/pregnancy_model.joblib")
 joblib.dump(label_encoders, "model/label_encoders.joblib")
 joblib.dump(target_encoder, "model/target_encoder.joblib")
+
+# Compiled flat-tree artifact used at serving time (no joblib/sklearn)
+export_compiled_model("model/pregnancy_model_compiled.json", model, label_encoders, target_encoder)
 print("✅ Model and encoders saved!")
 
 
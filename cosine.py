@@ -5,67 +5,132 @@
 
 
 # # models/cosine.py
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+
 import numpy as np
-import pandas as pd
-
-def recommend_foods(user_id, user_profiles, threshold_data, food_df, top_n=5):
-    nutrient_keys = {
-        "protein": "protein_g",
-        "fat": "fat_g",
-        "carbs": "carbs_g",
-        "iron": "iron_mg",
-        "calcium": "calcium_mg",
-        "vitaminA": "vitamin_a_mcg",
-        "vitaminC": "vitamin_c_mg",
-        "folate": "folic_acid_mcg"
-    }
 
+from regions import canonical_region
+
+nutrients = [
+    "protein", "fat", "carbs", "iron", "calcium",
+    "vitaminA", "vitaminC", "folate"
+]
+
+
+def _unit_rows(matrix):
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1e-10  # avoid divide-by-zero
+    return matrix / norms
+
+
+def top_n_indices(scores, n):
+    # O(len(scores)) selection, then sort only the n winners
+    n = min(n, len(scores))
+    if n <= 0:
+        return np.empty(0, dtype=np.intp)
+    top = np.argpartition(-scores, n - 1)[:n]
+    return top[np.argsort(-scores[top], kind="stable")]
+
+
+# L2-normalized food vectors for one catalog version, plus every region's
+# candidate rows and sub-matrix
+class CosineFoodIndex:
+    def __init__(self, catalog, columns=nutrients):
+        self.catalog = catalog
+        self.columns = list(columns)
+        self.matrix = _unit_rows(catalog.matrix[:, catalog.columns(self.columns)])
+        self.matrix.setflags(write=False)
+        self._partitions = catalog.region_partition.split(self.matrix)
+
+    def partition(self, region):
+        return self._partitions[self.catalog.region_partition.key(region)]
+
+    def query(self, vector, region, top_n=5):
+        rows, sub_matrix = self.partition(region)
+        user_norm = np.linalg.norm(vector)
+        if user_norm == 0:
+            user_norm = 1e-10  # avoid divide-by-zero
+        scores = sub_matrix @ (vector / user_norm)
+        top = top_n_indices(scores, top_n)
+        return rows[top], scores[top]
+
+    def records(self, rows, scores):
+        catalog = self.catalog
+        return [
+            {
+                "food_name": catalog.food_names[row],
+                "region": catalog.regions[row],
+                "similarity": float(score)
+            }
+            for row, score in zip(rows, scores)
+        ]
+
+
+_index = None
+_index_lock = threading.Lock()
+
+def get_cosine_index(catalog):
+    # Rebuilt only when the shared catalog is reloaded
+    global _index
+    index = _index
+    if index is not None and index.catalog is catalog:
+        return index
+    with _index_lock:
+        if _index is None or _index.catalog is not catalog:
+            _index = CosineFoodIndex(catalog)
+        return _index
+
+
+def recommend_foods(user_id, user_profiles, thresholds, food_index, top_n=5):
     # ✅ Get user
-    user = next((u for u in user_profiles if u["user_id"] == user_id), None)
+    user = user_profiles.get(user_id)
     if not user:
         raise ValueError(f"User ID {user_id} not found.")
-    
-    # ✅ Filter by region
-    user_region = user["region"].lower()
-    region_filtered_df = food_df[
-        (food_df["region"].str.lower() == user_region) | 
-        (food_df["region"].str.lower() == "all")
-    ].copy().reset_index(drop=True)
-
-    if region_filtered_df.empty:
+
+    # ✅ Precomputed region partition
+    user_region = canonical_region(user["region"])
+    if len(food_index.partition(user_region)[0]) == 0:
         raise ValueError(f"No food items found for region: {user_region}")
 
-    # ✅ Merge stage + precondition thresholds
-    combined_threshold = threshold_data.get(user["stage"], {})
-    for condition, present in user["preconditions"].items():
-        if present:
-            condition_threshold = threshold_data.get(condition.lower(), {})
-            for k, v in condition_threshold.items():
-                combined_threshold[k] = max(combined_threshold.get(k, 0), v)
-
-    # ✅ Build user vector
-    user_nutrient_vector = np.array([
-        combined_threshold.get(thresh_key, 0) 
-        for _, thresh_key in nutrient_keys.items()
+    # ✅ Precompiled stage + precondition thresholds (read-only, shared)
+    user_nutrient_vector = thresholds.for_user(user)[thresholds.columns(food_index.columns)]
+
+    # ✅ One dot product against pre-normalized food vectors, top N by argpartition
+    rows, similarities = food_index.query(user_nutrient_vector, user_region, top_n)
+    return food_index.records(rows, similarities)
+
+
+def recommend_foods_batch(users, thresholds, food_index, top_n=5):
+    # Scores every user against every food with a single (users x foods)
+    # matmul, then keeps the top N of each user's region partition.
+    # Users sharing a threshold signature share a row.
+    results, errors = {}, {}
+    if not users:
+        return results, errors
+
+    signatures = {}
+    user_rows = []
+    for user in users:
+        signature = thresholds.signature(user)
+        user_rows.append(signatures.setdefault(signature, len(signatures)))
+    user_matrix = np.vstack([
+        thresholds.vector(signature)[thresholds.columns(food_index.columns)]
+        for signature in signatures
     ])
-    user_norm = np.linalg.norm(user_nutrient_vector)
-    if user_norm == 0:
-        user_norm = 1e-10  # avoid divide-by-zero
-    user_vec_norm = user_nutrient_vector / user_norm
-
-    # ✅ Build food vectors
-    food_vectors = region_filtered_df[list(nutrient_keys.keys())].fillna(0).values
-    norms = np.linalg.norm(food_vectors, axis=1, keepdims=True)
-    norms[norms == 0] = 1e-10
-    food_vectors_norm = food_vectors / norms
-
-    # ✅ Compute cosine similarity
-    similarities = cosine_similarity([user_vec_norm], food_vectors_norm)[0]
-    region_filtered_df["similarity"] = similarities
-
-    # ✅ Return top N foods
-    return region_filtered_df.sort_values(by="similarity", ascending=False).head(top_n)
+
+    scores = _unit_rows(user_matrix) @ food_index.matrix.T
+
+    for user, row in zip(users, user_rows):
+        region = canonical_region(user["region"])
+        candidates, _ = food_index.partition(region)
+        if len(candidates) == 0:
+            errors[user["user_id"]] = f"No food items found for region: {region}"
+            continue
+
+        candidate_scores = scores[row, candidates]
+        top = top_n_indices(candidate_scores, top_n)
+        results[user["user_id"]] = food_index.records(candidates[top], candidate_scores[top])
+    return results, errors
 
 
 # def recommend_foods(user_id, user_profiles, threshold_data, food_df, top_n=5):
@@ -0,0 +1,152 @@
+import hashlib
+import io
+import os
+import threading
+
+import numpy as np
+
+from metrics import span
+from regions import RegionPartition
+from registry import registry
+from snapshot import SNAPSHOT_DIR, Snapshot, write_snapshot
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FOOD_PATH = os.path.join(BASE_DIR, "nepalifood.csv")
+CATALOG_SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "nepalifood")
+
+# Canonical nutrient column order of the catalog matrix. Columns missing from
+# the CSV (e.g. iodine) are kept as zeros so every consumer sees the same shape.
+NUTRIENTS = [
+    "calories", "protein", "fat", "carbs", "iron", "calcium",
+    "vitaminA", "vitaminC", "folate", "iodine"
+]
+
+
+class FoodCatalog:
+    def __init__(self, df, version, digest=None, matrix=None):
+        self.df = df
+        self.version = version
+        # Content hash, stable across checkouts (unlike the mtime version)
+        self.digest = digest
+
+        self.food_ids = df["food_id"].to_numpy()
+        self.food_names = df["food_name"].to_numpy()
+        self.regions = df["region"].to_numpy()
+
+        # Dense (foods x nutrients) matrix in NUTRIENTS order; a snapshot
+        # passes in its memory-mapped copy
+        self.nutrient_index = {n: i for i, n in enumerate(NUTRIENTS)}
+        if matrix is None:
+            matrix = np.zeros((len(df), len(NUTRIENTS)), dtype=np.float64)
+            for i, n in enumerate(NUTRIENTS):
+                if n in df.columns:
+                    matrix[:, i] = df[n].fillna(0).to_numpy(dtype=np.float64)
+            matrix.setflags(write=False)
+        self.matrix = matrix
+
+        # food_id -> row (-1 where the id is unused)
+        size = int(self.food_ids.max()) + 1 if len(df) else 0
+        self.row_by_id = np.full(size, -1, dtype=np.intp)
+        self.row_by_id[self.food_ids[::-1]] = np.arange(len(df))[::-1]
+
+        # lowercase food_name -> row (first occurrence wins, like .iloc[0])
+        self.row_by_name = {}
+        for row, name in enumerate(self.food_names):
+            self.row_by_name.setdefault(str(name).lower(), row)
+
+        # Canonical region -> candidate rows (region + 'all')
+        self.region_partition = RegionPartition(self.regions)
+
+    @classmethod
+    def load(cls, path=FOOD_PATH, snapshot_path=CATALOG_SNAPSHOT_PATH):
+        import pandas as pd
+
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha1(data).hexdigest()
+        # Compiled snapshot of this exact CSV content, if there is one
+        snapshot = Snapshot.open(snapshot_path) if snapshot_path else None
+        if snapshot is not None and snapshot.meta.get("sha1") == digest:
+            return cls.from_snapshot(snapshot, (stat.st_mtime_ns, stat.st_size))
+        df = pd.read_csv(io.BytesIO(data))
+        return cls(df, (stat.st_mtime_ns, stat.st_size), digest)
+
+    @classmethod
+    def from_snapshot(cls, snapshot, version):
+        import pandas as pd
+
+        columns = {}
+        for name in snapshot.meta["columns"]:
+            if snapshot.columns[name] == "array":
+                columns[name] = snapshot.array(name)
+            else:
+                columns[name] = snapshot.decode(name, missing=np.nan)
+        df = pd.DataFrame(columns, columns=snapshot.meta["columns"])
+        return cls(df, version, snapshot.meta["sha1"], matrix=snapshot.array("matrix"))
+
+    def to_snapshot(self, path):
+        # String columns are dictionary-encoded; numeric ones keep their dtype
+        arrays, strings = {"matrix": self.matrix}, {}
+        for name in self.df.columns:
+            column = self.df[name]
+            if column.dtype == object:
+                strings[name] = [v if isinstance(v, str) else None for v in column.tolist()]
+            else:
+                arrays[name] = column.to_numpy()
+        write_snapshot(path, {"sha1": self.digest, "columns": list(self.df.columns)}, arrays=arrays, strings=strings)
+
+    def __len__(self):
+        return len(self.food_ids)
+
+    def row_for_id(self, food_id):
+        if 0 <= food_id < len(self.row_by_id):
+            return int(self.row_by_id[food_id])
+        return -1
+
+    def rows_for_ids(self, food_ids):
+        ids = np.asarray(food_ids, dtype=np.intp)
+        rows = np.full(ids.shape, -1, dtype=np.intp)
+        valid = (ids >= 0) & (ids < len(self.row_by_id))
+        rows[valid] = self.row_by_id[ids[valid]]
+        return rows
+
+    def row_for_name(self, food_name):
+        return self.row_by_name.get(food_name.lower(), -1)
+
+    def columns(self, names):
+        return [self.nutrient_index[n] for n in names]
+
+    def region_rows(self, region):
+        return self.region_partition.rows(region)
+
+
+_catalogs = {}
+_catalogs_lock = threading.Lock()
+
+
+def get_food_catalog(path=FOOD_PATH):
+    # Shared per-process catalog, reloaded only when the CSV changes on disk
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    catalog = _catalogs.get(path)
+    if catalog is not None and catalog.version == version:
+        return catalog
+    with _catalogs_lock:
+        catalog = _catalogs.get(path)
+        if catalog is None or catalog.version != version:
+            with registry.timing("load", "food_catalog"), span("catalog_load", source="food_catalog"):
+                catalog = FoodCatalog.load(path)
+            _catalogs[path] = catalog
+        return catalog
+
+
+registry.add_warmer("food_catalog", get_food_catalog)
+
+
+def compile_catalog_snapshot(path=FOOD_PATH, snapshot_path=CATALOG_SNAPSHOT_PATH):
+    # Always parses the CSV itself, never an older snapshot
+    catalog = FoodCatalog.load(path, snapshot_path=None)
+    catalog.to_snapshot(snapshot_path)
+    return snapshot_path, len(catalog)
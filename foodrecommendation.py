@@ -1,45 +1,94 @@
 # routers/recommendations.py
 
 from fastapi import APIRouter, HTTPException
-import pandas as pd
-import json
-import os
-
-from cosine import recommend_foods  # this should be your own function
+from pydantic import BaseModel, Field
+from typing import List, Literal, Union
+import logging
+
+from foodcatalog import get_food_catalog
+from profiles import get_profile_store
+from thresholds import get_threshold_compiler
+from cosine import get_cosine_index, recommend_foods, recommend_foods_batch
+from metrics import metrics, span
+from regions import canonical_region
+from responsecache import ResponseCache, data_version, json_response
 
 router = APIRouter()
+logger = logging.getLogger(__name__)
+
+# Results only depend on the user's region, stage and preconditions, so
+# users sharing those share an entry
+response_cache = ResponseCache("foodrecommendation")
+metrics.add_cache("foodrecommendation_responses", response_cache)
 
 @router.get("/foodrecommendation/{user_id}")
 def get_recommendations(user_id: str, top_n: int = 5):
     try:
-        print("🔍 Request received for:", user_id)
-
-        # ✅ Load data INSIDE the route
-        food_df = pd.read_csv("nepalifood.csv")
-
-        with open("user_profiles.json", "r", encoding="utf-8") as f:
-            user_profiles = json.load(f)
-
-        with open("threshold.json", "r", encoding="utf-8") as f:
-            threshold_data = json.load(f)["nutrient_thresholds"]
+        logger.debug("Food recommendation request for %s", user_id)
+
+        # ✅ Pre-normalized food index, rebuilt only when the CSV changes
+        with span("catalog_load", router="foodrecommendation"):
+            food_index = get_cosine_index(get_food_catalog())
+            user_profiles = get_profile_store("maternal")
+            thresholds = get_threshold_compiler()
+
+        # ✅ Cached by input signature + catalog/threshold content version
+        user = user_profiles.get(user_id)
+        if user is None:
+            raise HTTPException(status_code=404, detail=f"User ID {user_id} not found.")
+        key = response_cache.key(
+            data_version(food_index.catalog.digest, thresholds.digest),
+            canonical_region(user["region"]), thresholds.signature(user), top_n
+        )
+        body = response_cache.get(key)
+        if body is not None:
+            return json_response(body)
 
         # ✅ Call your recommender function
-        top_foods = recommend_foods(user_id, user_profiles, threshold_data, food_df, top_n)
+        with span("similarity_scoring", router="foodrecommendation"):
+            result = recommend_foods(user_id, user_profiles, thresholds, food_index, top_n)
+        return json_response(response_cache.set(key, result))
 
-        # ✅ Return simplified output for now
-        return top_foods[[
-            "food_name", "region", "similarity"
-        ]].to_dict(orient="records")
+    except HTTPException:
+        raise
 
     except ValueError as e:
-        print("❌ ValueError:", e)
+        logger.info("Food recommendation for %s failed: %s", user_id, e)
         raise HTTPException(status_code=404, detail=str(e))
 
-    except Exception as e:
-        print("❌ Unknown error:", e)
+    except Exception:
+        logger.exception("Food recommendation for %s failed", user_id)
         raise HTTPException(status_code=500, detail="Internal server error")
 
 
+class BatchRecommendationRequest(BaseModel):
+    user_ids: Union[Literal["all"], List[str]]
+    top_n: int = Field(5, ge=1)
+
+
+@router.post("/foodrecommendation/batch")
+def get_batch_recommendations(request: BatchRecommendationRequest):
+    user_profiles = get_profile_store("maternal")
+
+    if request.user_ids == "all":
+        users = user_profiles.all()
+        missing = []
+    else:
+        unique_ids = list(dict.fromkeys(request.user_ids))
+        users = [user_profiles.get(uid) for uid in unique_ids]
+        missing = [uid for uid, user in zip(unique_ids, users) if user is None]
+        users = [user for user in users if user is not None]
+
+    with span("similarity_scoring", router="foodrecommendation_batch"):
+        results, errors = recommend_foods_batch(
+            users, get_threshold_compiler(), get_cosine_index(get_food_catalog()), request.top_n
+        )
+    for uid in missing:
+        errors[uid] = f"User ID {uid} not found."
+
+    return {"results": results, "errors": errors}
+
+
 
 
 
@@ -0,0 +1,76 @@
+import numpy as np
+
+from snapshot import Snapshot, write_snapshot
+
+
+def compile_forest(model):
+    # Concatenates the trees of a fitted single-output RandomForestRegressor
+    # into flat node arrays. children holds every node's right child followed
+    # by every node's left child, so the next node is children[went_left * n
+    # + node]. Leaves point to themselves (feature 0), so a walk of max_depth
+    # steps ends on every sample's leaf.
+    features, thresholds, lefts, rights, values, roots = [], [], [], [], [], []
+    offset = 0
+    for estimator in model.estimators_:
+        tree = estimator.tree_
+        nodes = np.arange(tree.node_count)
+        leaf = tree.children_left == -1
+        roots.append(offset)
+        features.append(np.where(leaf, 0, tree.feature))
+        thresholds.append(tree.threshold)
+        lefts.append(np.where(leaf, nodes, tree.children_left) + offset)
+        rights.append(np.where(leaf, nodes, tree.children_right) + offset)
+        values.append(tree.value[:, 0, 0])
+        offset += tree.node_count
+    return {
+        "feature": np.concatenate(features).astype(np.intp),
+        "threshold": np.concatenate(thresholds).astype(np.float64),
+        "children": np.concatenate(rights + lefts).astype(np.intp),
+        "value": np.concatenate(values).astype(np.float64),
+        "roots": np.array(roots, dtype=np.intp),
+    }, max(estimator.tree_.max_depth for estimator in model.estimators_)
+
+
+def export_compiled_forest(path, model, source_sha1, extra_arrays=None):
+    # extra_arrays: anything else the predictor's users want mapped alongside
+    arrays, max_depth = compile_forest(model)
+    write_snapshot(path, {
+        "sha1": source_sha1,
+        "max_depth": int(max_depth),
+        "n_features": int(model.n_features_in_),
+    }, arrays={**arrays, **(extra_arrays or {})})
+    return len(arrays["roots"])
+
+
+# RandomForestRegressor.predict over memory-mapped node arrays. Every
+# process serving from the same snapshot shares those pages, where an
+# unpickled forest is a private copy per worker.
+class ForestPredictor:
+    def __init__(self, snapshot):
+        self.max_depth = snapshot.meta["max_depth"]
+        self.n_features_in_ = snapshot.meta["n_features"]
+        self.feature = snapshot.array("feature")
+        self.threshold = snapshot.array("threshold")
+        self.children = snapshot.array("children")
+        self.value = snapshot.array("value")
+        self.roots = snapshot.array("roots")
+
+    @classmethod
+    def open(cls, path, source_sha1):
+        # None unless path holds a compiled copy of exactly that artifact
+        snapshot = Snapshot.open(path)
+        if snapshot is None or snapshot.meta.get("sha1") != source_sha1:
+            return None
+        return cls(snapshot)
+
+    def predict(self, X):
+        # Trees compare float32 inputs, like sklearn does
+        X = np.asarray(X, dtype=np.float32)
+        flat = X.ravel()
+        rows = np.arange(len(X)) * X.shape[1]
+        n_nodes = len(self.feature)
+        nodes = np.repeat(self.roots[:, None], len(X), axis=1)  # (trees, samples)
+        for _ in range(self.max_depth):
+            went_left = flat[rows + self.feature[nodes]] <= self.threshold[nodes]
+            nodes = self.children[went_left * n_nodes + nodes]
+        return self.value[nodes].sum(axis=0) / len(self.roots)
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+from fastapi import Response
+
+from metrics import span
+
+
+# A JSON array of records loaded into memory with an id -> record index.
+# refresh() re-reads the file (at most once per reload_interval) when its
+# mtime/size change; readers always see one consistent snapshot.
+class JsonCollection:
+    def __init__(self, path, key="id", reload_interval=1.0):
+        self.path = path
+        self.key = key
+        self.reload_interval = reload_interval
+        self._lock = threading.Lock()
+        self._checked = 0.0
+        self._snapshot = None
+        self._derived = (None, {})
+        self._load()
+
+    def _stat(self):
+        stat = os.stat(self.path)
+        return (stat.st_mtime_ns, stat.st_size)
+
+    def _load(self):
+        version = self._stat()
+        with span("file_io", target=os.path.basename(self.path)), open(self.path, "r", encoding="utf-8") as f:
+            items = json.load(f)
+        by_id = {item[self.key]: item for item in items}
+        self._snapshot = (items, by_id, version)
+        self._checked = time.monotonic()
+
+    def refresh(self):
+        now = time.monotonic()
+        if now - self._checked >= self.reload_interval:
+            with self._lock:
+                if now - self._checked >= self.reload_interval:
+                    self._checked = now
+                    if self._stat() != self._snapshot[2]:
+                        self._load()
+        return self
+
+    def derived(self, name, build):
+        # Values computed once per loaded snapshot (e.g. pre-rendered
+        # responses); build(items, by_id) runs again only after a reload
+        items, by_id, version = self._snapshot
+        cache = self._derived
+        if cache[0] != version:
+            cache = self._derived = (version, {})
+        value = cache[1].get(name)
+        if value is None:
+            value = cache[1][name] = build(items, by_id)
+        return value
+
+    def snapshot(self):
+        # (items, by_id, version) from the same load
+        return self._snapshot
+
+    @property
+    def items(self):
+        return self._snapshot[0]
+
+    @property
+    def by_id(self):
+        return self._snapshot[1]
+
+    @property
+    def version(self):
+        return self._snapshot[2]
+
+
+def json_bytes(content):
+    # Same encoding FastAPI's JSONResponse uses
+    return json.dumps(
+        content, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")
+    ).encode("utf-8")
+
+
+# A JSON body serialized once, with a strong ETag over its bytes
+class RenderedJson:
+    __slots__ = ("body", "etag")
+
+    def __init__(self, content):
+        self.body = json_bytes(content)
+        self.etag = '"%s"' % hashlib.sha1(self.body).hexdigest()
+
+
+def _etag_matches(if_none_match, etag):
+    if if_none_match.strip() == "*":
+        return True
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def cached_response(request, rendered):
+    # 304 without a body when the client already has this version
+    headers = {"ETag": rendered.etag, "Cache-Control": "no-cache"}
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match and _etag_matches(if_none_match, rendered.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=rendered.body, media_type="application/json", headers=headers)
@@ -1,35 +1,93 @@
-from fastapi import FastAPI, Body
-from pydantic import BaseModel
+from registry import registry
 
-from fastapi import Query
+with registry.timing("import", "fastapi"):
+    from fastapi import FastAPI, Body, HTTPException, Response
+    from fastapi.concurrency import run_in_threadpool
+    from pydantic import BaseModel
+
+from contextlib import asynccontextmanager
 from typing import List
-import joblib
-import pandas as pd
 import os
 
-from recommender import NutrientGapRecommender
-from complication_model import ComplicationPredictor
-from articles import router as articles_router
-from foodrecommendation import router as recommendations
-from meals import router as meals_router
-from nutritionintake import router as intake_router
+with registry.timing("import", "persistence"):
+    from persistence import writer
+with registry.timing("import", "metrics"):
+    from metrics import MetricsMiddleware, metrics, span
+with registry.timing("import", "responsecache"):
+    from responsecache import ResponseCache, data_version, json_response
+with registry.timing("import", "regions"):
+    from regions import canonical_region
+with registry.timing("import", "complication_model"):
+    from complication_model import ComplicationPredictor
+with registry.timing("import", "articles"):
+    from articles import router as articles_router
+with registry.timing("import", "foodrecommendation"):
+    from foodrecommendation import router as recommendations
+with registry.timing("import", "mealplan"):
+    from mealplan import router as mealplan_router
+with registry.timing("import", "meals"):
+    from meals import router as meals_router
+with registry.timing("import", "nutritionintake"):
+    from nutritionintake import router as intake_router
+with registry.timing("import", "profiles"):
+    from profiles import compact_profile_stores, router as profiles_router
+
+with registry.timing("import", "recipes"):
+    from recipes import router as recipes_router
+with registry.timing("import", "sperm"):
+    from sperm import router as sperm_router
+
+# ==== Load Models (lazily, on first use) ====
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-from recipes import router as recipes_router
-from sperm import router as sperm_router
+def load_recommender():
+    import joblib
+    return joblib.load(os.path.join(BASE_DIR, "model", "recommender_model.joblib"))
 
-app = FastAPI()
+def load_complication_model():
+    return ComplicationPredictor(
+        os.path.join(BASE_DIR, "model", "pregnancy_model_compiled.json"),
+    )
 
-# ==== Load Models ====
-BASE_DIR = os.path.dirname(os.path.abspath(__file__))
-recommender = joblib.load(os.path.join(BASE_DIR, "model", "recommender_model.joblib"))
+registry.register("recommender", load_recommender)
+registry.register("complication_model", load_complication_model)
+
+
+@asynccontextmanager
+async def lifespan(app):
+    # MAMACARE_WARMUP=1 loads every registered resource before serving
+    # traffic; otherwise each one loads on its first request.
+    if os.environ.get("MAMACARE_WARMUP", "0") == "1":
+        await run_in_threadpool(registry.warm_up)
+    # Meal log / profile journal writes go through one group-committing task
+    await writer.start()
+    yield
+    # Persist the meal store's running day totals, then flush the queue
+    if registry.is_loaded("meal_store"):
+        registry.get("meal_store").checkpoint()
+    await writer.stop()
+    # Fold the profile journals into their JSON files
+    compact_profile_stores()
+
+app = FastAPI(lifespan=lifespan)
 
+app.add_middleware(MetricsMiddleware)
 
-complication_model = ComplicationPredictor(
-    os.path.join(BASE_DIR, "model", "pregnancy_model.joblib"),
-    os.path.join(BASE_DIR, "model", "label_encoders.joblib"),
-    os.path.join(BASE_DIR, "model", "target_encoder.joblib"),
-)
-app = FastAPI()
+@app.get("/startup-report")
+def startup_report():
+    return {**registry.report(), "writer": writer.stats()}
+
+def _component_metrics():
+    for entry in registry.timings.values():
+        yield "mamacare_component_seconds", (("kind", entry["kind"]), ("name", entry["name"])), entry["seconds"]
+    for key, value in writer.stats().items():
+        yield f"mamacare_writer_{key}", (), int(value)
+
+metrics.add_collector(_component_metrics)
+
+@app.get("/metrics")
+def prometheus_metrics():
+    return Response(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # ==== Recommender Input ====
 class RecommendationRequest(BaseModel):
@@ -37,14 +95,27 @@ class RecommendationRequest(BaseModel):
     food_names: List[str]
     top_n: int = 5
 
+# Intake only depends on the set of (case-insensitive) food names
+recommend_cache = ResponseCache("recommend")
+metrics.add_cache("recommend_responses", recommend_cache)
+
 @app.post("/recommend")
 def recommend_food(data: RecommendationRequest):
-    result = recommender.recommend_by_gap(
-        user_region=data.user_region,
-        food_names=data.food_names,
-        top_n=data.top_n
+    recommender = registry.get("recommender")
+    key = recommend_cache.key(
+        data_version(recommender.catalog.digest),
+        canonical_region(data.user_region), sorted({name.lower() for name in data.food_names}), data.top_n
     )
-    return result.to_dict(orient="records")
+    body = recommend_cache.get(key)
+    if body is None:
+        with span("model_predict", model="recommender"):
+            result = recommender.recommend_by_gap(
+                user_region=data.user_region,
+                food_names=data.food_names,
+                top_n=data.top_n
+            )
+        body = recommend_cache.set(key, result.to_dict(orient="records"))
+    return json_response(body)
 
 
 
@@ -63,32 +134,25 @@ class SymptomInput(BaseModel):
 
 @app.post("/predict-complication")
 def predict_complication(symptom: SymptomInput):
-    condition = complication_model.predict(symptom.dict())
+    model = registry.get("complication_model")
+    try:
+        with span("model_predict", model="complication"):
+            condition = model.predict(symptom.dict())
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
     return {"predicted_condition": condition}
 
+@app.post("/predict-complication/batch")
+def predict_complication_batch(symptoms: List[SymptomInput]):
+    model = registry.get("complication_model")
+    try:
+        with span("model_predict", model="complication_batch"):
+            conditions = model.predict_batch([s.dict() for s in symptoms])
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    return {"predicted_conditions": conditions}
 
 
-@app.get("/recipes/search")
-def search_recipes(q: str = Query(..., min_length=1)):
-    q_lower = q.lower()
-    results = [
-        {
-            "id": r["id"],
-            "name": r["name"],
-            "category": r["category"],
-            "calories": r["calories"],
-            "protein": r["protein"],
-            "fat": r["fat"],
-            "carbs": r["carbs"],
-            "iron": r["iron"],
-            "calcium": r["calcium"],
-            "vitaminA": r["vitaminA"],
-            "vitaminC": r["vitaminC"],
-            "folate": r["folate"]
-        }
-        for r in recipes if q_lower in r["name"].lower()
-    ]
-    return results
 
 # Other endpoints...
 
@@ -96,6 +160,8 @@ app.include_router(articles_router)
 
 app.include_router(meals_router)
 
+app.include_router(mealplan_router)
+
 app.include_router(recipes_router)
 
 app.include_router(recommendations)
@@ -104,6 +170,8 @@ app.include_router(intake_router)
 
 app.include_router(sperm_router)
 
+app.include_router(profiles_router)
+
 
 
 
@@ -0,0 +1,289 @@
+from fastapi import APIRouter, HTTPException, Query
+from datetime import date as date_type
+from types import SimpleNamespace
+from typing import Optional
+import os
+import threading
+import time
+
+import numpy as np
+
+from foodcatalog import NUTRIENTS as TOTAL_NUTRIENTS, get_food_catalog
+from lrucache import LRUCache
+from meals import valid_date
+from mealstore import get_current_meal_store
+from metrics import metrics, span
+from profiles import get_profile_store
+from registry import registry
+from recipes import get_recipes
+from regions import ALL, RegionPartition, canonical_region
+from thresholds import NUTRIENTS, get_threshold_compiler
+
+router = APIRouter()
+
+# threshold.json has no energy targets, so the daily calorie ceiling comes
+# from the stage (overridable per request with max_calories)
+CALORIE_LIMITS = {"planning": 2000, "prenatal": 2300, "postpartum": 2500}
+DEFAULT_CALORIE_LIMIT = 2200
+
+MAX_SERVINGS = 2           # per food / recipe
+MAX_ITEMS = 8              # servings in one plan
+CALORIE_WEIGHT = 0.01      # tie-breaker: fewer calories for the same coverage
+GAP_BUCKETS = 10           # remaining gap rounded up to 10% steps for caching
+CALORIE_BUCKET = 100       # calorie budget rounded down to 100 kcal
+
+SOLVE_BUDGET = float(os.environ.get("MAMACARE_MEALPLAN_BUDGET_MS", "200")) / 1000
+
+# Positions in the meal store's running day totals
+CALORIES_COLUMN = TOTAL_NUTRIENTS.index("calories")
+EATEN_COLUMNS = [TOTAL_NUTRIENTS.index(n) for n in NUTRIENTS]
+
+plan_cache = LRUCache(maxsize=int(os.environ.get("MAMACARE_MEALPLAN_CACHE_SIZE", "4096")))
+metrics.add_cache("meal_plans", plan_cache)
+
+
+# Foods from the catalog plus recipes from recipes.json as one
+# (items x [calories, NUTRIENTS...]) matrix, with per-region row lists
+class MealCandidates:
+    def __init__(self, catalog, recipes):
+        self.catalog = catalog
+        self.recipes_version = recipes.version
+
+        food_matrix = catalog.matrix[:, catalog.columns(["calories"] + NUTRIENTS)]
+        recipe_matrix = np.array(
+            [[float(r.get(n) or 0) for n in ["calories"] + NUTRIENTS] for r in recipes.items],
+            dtype=np.float64
+        ).reshape(len(recipes.items), len(NUTRIENTS) + 1)
+        matrix = np.vstack([food_matrix, recipe_matrix])
+
+        self.calories = np.ascontiguousarray(matrix[:, 0])
+        self.nutrients = np.ascontiguousarray(matrix[:, 1:])
+        self.sources = ["food"] * len(catalog) + ["recipe"] * len(recipes.items)
+        self.ids = catalog.food_ids.tolist() + [r["id"] for r in recipes.items]
+        self.names = catalog.food_names.tolist() + [r["name"] for r in recipes.items]
+        self.region_partition = RegionPartition(
+            catalog.regions.tolist() + [r.get("region", ALL) for r in recipes.items]
+        )
+
+    def rows(self, region):
+        # Region's own items plus the ones marked 'all'
+        return self.region_partition.rows(region)
+
+
+_candidates = None
+_candidates_lock = threading.Lock()
+
+
+def get_meal_candidates():
+    # Rebuilt when either the catalog or recipes.json is reloaded
+    global _candidates
+    catalog = get_food_catalog()
+    recipes = get_recipes()
+    candidates = _candidates
+    if candidates is not None and candidates.catalog is catalog and candidates.recipes_version == recipes.version:
+        return candidates
+    with _candidates_lock:
+        if _candidates is None or _candidates.catalog is not catalog or _candidates.recipes_version != recipes.version:
+            _candidates = MealCandidates(catalog, recipes)
+        return _candidates
+
+
+registry.add_warmer("meal_candidates", get_meal_candidates)
+
+
+def plan_objective(coverage, servings, calories, calorie_budget):
+    # Normalized shortfall over the open nutrients plus a calorie tie-breaker
+    shortfall = np.maximum(1.0 - servings @ coverage, 0).sum()
+    return shortfall + CALORIE_WEIGHT * (calories @ servings) / calorie_budget
+
+
+def solve_greedy(coverage, calories, calorie_budget):
+    # Repeatedly add the serving that closes the most remaining (normalized)
+    # gap, while it still fits the calorie budget
+    servings = np.zeros(len(calories))
+    remaining = np.ones(coverage.shape[1])
+    calories_left = calorie_budget
+    penalty = CALORIE_WEIGHT * calories / calorie_budget
+    for _ in range(MAX_ITEMS):
+        gains = np.minimum(coverage, remaining).sum(axis=1) - penalty
+        gains[(calories > calories_left) | (servings >= MAX_SERVINGS)] = -np.inf
+        best = int(np.argmax(gains))
+        if gains[best] <= 0:
+            break
+        servings[best] += 1
+        remaining = np.maximum(remaining - coverage[best], 0)
+        calories_left -= calories[best]
+        if not remaining.any():
+            break
+    return servings
+
+
+def load_milp():
+    # scipy is optional and takes most of a second to import, so it is
+    # loaded through the registry (warm-up) rather than inside a request
+    try:
+        from scipy import optimize, sparse
+    except ImportError:
+        return None
+    return SimpleNamespace(optimize=optimize, sparse=sparse)
+
+
+registry.register("milp", load_milp)
+_milp_loading = threading.Lock()
+
+
+def get_milp():
+    # The solver, or None while it isn't imported yet (or scipy is missing).
+    # Without warm-up the first request starts the import in the background
+    # and is answered by the greedy solver.
+    if registry.is_loaded("milp"):
+        return registry.get("milp")
+    if _milp_loading.acquire(blocking=False):
+        threading.Thread(target=registry.get, args=("milp",), daemon=True).start()
+    return None
+
+
+def solve_milp(scipy, coverage, calories, calorie_budget, time_limit):
+    # min sum(shortfall) + w * calories/budget
+    #   s.t. coverage.T @ x + shortfall >= 1, calories @ x <= budget,
+    #        sum(x) <= MAX_ITEMS, x integer in [0, MAX_SERVINGS], 0 <= shortfall <= 1
+    Bounds, LinearConstraint, milp = scipy.optimize.Bounds, scipy.optimize.LinearConstraint, scipy.optimize.milp
+    eye, hstack, vstack, csr_matrix = scipy.sparse.eye, scipy.sparse.hstack, scipy.sparse.vstack, scipy.sparse.csr_matrix
+
+    n_items, n_nutrients = coverage.shape
+    c = np.concatenate([CALORIE_WEIGHT * calories / calorie_budget, np.ones(n_nutrients)])
+    constraints = LinearConstraint(
+        vstack([
+            hstack([csr_matrix(coverage.T), eye(n_nutrients)]),
+            hstack([csr_matrix(calories[None, :]), csr_matrix((1, n_nutrients))]),
+            hstack([csr_matrix(np.ones((1, n_items))), csr_matrix((1, n_nutrients))]),
+        ]).tocsr(),
+        np.concatenate([np.ones(n_nutrients), [-np.inf, -np.inf]]),
+        np.concatenate([np.full(n_nutrients, np.inf), [calorie_budget, MAX_ITEMS]]),
+    )
+    result = milp(
+        c,
+        constraints=constraints,
+        integrality=np.concatenate([np.ones(n_items), np.zeros(n_nutrients)]),
+        bounds=Bounds(0, np.concatenate([np.full(n_items, MAX_SERVINGS), np.ones(n_nutrients)])),
+        options={"time_limit": max(time_limit, 0.001)},
+    )
+    if result.x is None:
+        return None
+    return np.round(result.x[:n_items])
+
+
+def optimize_plan(candidates, rows, gap, calorie_budget, time_budget=SOLVE_BUDGET):
+    # Returns ({row: servings}, solver). gap is the remaining requirement per
+    # nutrient; only items that fit on their own are considered.
+    started = time.perf_counter()
+    rows = rows[candidates.calories[rows] <= calorie_budget]
+    # Nutrients none of the candidates provide (e.g. iodine without data)
+    # can't change the plan
+    open_nutrients = (gap > 0) & (candidates.nutrients[rows] > 0).any(axis=0)
+    if not open_nutrients.any() or len(rows) == 0:
+        return {}, "none"
+
+    coverage = candidates.nutrients[np.ix_(rows, open_nutrients)] / gap[open_nutrients]
+    calories = candidates.calories[rows]
+
+    servings = solve_greedy(coverage, calories, calorie_budget)
+    solver = "greedy"
+    scipy = get_milp()
+    time_left = time_budget - (time.perf_counter() - started)
+    if scipy is not None and time_left > 0:
+        exact = solve_milp(scipy, coverage, calories, calorie_budget, time_left)
+        if exact is not None and (
+            plan_objective(coverage, exact, calories, calorie_budget)
+            < plan_objective(coverage, servings, calories, calorie_budget)
+        ):
+            servings, solver = exact, "milp"
+
+    chosen = np.flatnonzero(servings > 0)
+    return {int(rows[i]): int(servings[i]) for i in chosen}, solver
+
+
+def bucket_gap(gap, required):
+    # Remaining gap as tenths of the requirement, rounded up so a cached plan
+    # covers at least the actual gap
+    with np.errstate(divide="ignore", invalid="ignore"):
+        fraction = np.where(required > 0, gap / required, 0)
+    return tuple(np.ceil(np.clip(fraction, 0, 1) * GAP_BUCKETS).astype(int).tolist())
+
+
+@router.get("/mealplan/{user_id}")
+def meal_plan(
+    user_id: str,
+    date: Optional[str] = Query(None),
+    max_calories: Optional[float] = Query(None, gt=0),
+):
+    user = get_profile_store("maternal").get(user_id)
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    if date is not None and not valid_date(date):
+        raise HTTPException(status_code=400, detail=f"Invalid date: {date}")
+    day = date or date_type.today().isoformat()
+    catalog = get_food_catalog()
+    thresholds = get_threshold_compiler()
+    candidates = get_meal_candidates()
+
+    # What's still missing today after the meals already logged
+    signature = thresholds.signature(user)
+    required = thresholds.vector(signature)
+    day_totals = get_current_meal_store().day_totals(user_id, day)
+    eaten = day_totals[EATEN_COLUMNS]
+    calorie_limit = max_calories or CALORIE_LIMITS.get(signature[0], DEFAULT_CALORIE_LIMIT)
+    calorie_budget = float(np.floor(max(calorie_limit - day_totals[CALORIES_COLUMN], 0) / CALORIE_BUCKET) * CALORIE_BUCKET)
+
+    region = canonical_region(user.get("region", ALL))
+    buckets = bucket_gap(np.maximum(required - eaten, 0), required)
+    # Plans made before the MILP solver finished importing aren't reused after
+    key = (
+        catalog.digest, thresholds.version, candidates.recipes_version, signature,
+        region, buckets, calorie_budget, registry.is_loaded("milp"),
+    )
+
+    cached = plan_cache.get(key)
+    if cached is None:
+        gap = required * np.array(buckets) / GAP_BUCKETS
+        if calorie_budget > 0:
+            with span("plan_optimize"):
+                cached = optimize_plan(candidates, candidates.rows(region), gap, calorie_budget)
+        else:
+            cached = ({}, "none")
+        plan_cache.set(key, cached)
+        from_cache = False
+    else:
+        from_cache = True
+    plan, solver = cached
+
+    rows = np.array(list(plan), dtype=np.intp)
+    servings = np.array(list(plan.values()), dtype=np.float64)
+    planned = servings @ candidates.nutrients[rows] if len(rows) else np.zeros(len(NUTRIENTS))
+    gap = np.maximum(required - eaten, 0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        covered = np.where(gap > 0, np.minimum(planned / gap, 1) * 100, 100.0)
+
+    return {
+        "user_id": user_id,
+        "date": day,
+        "region": region,
+        "calorie_budget": calorie_budget,
+        "solver": solver,
+        "cached": from_cache,
+        "items": [
+            {
+                "source": candidates.sources[row],
+                "id": candidates.ids[row],
+                "name": candidates.names[row],
+                "servings": count,
+                "calories": round(float(candidates.calories[row]) * count, 2),
+            }
+            for row, count in plan.items()
+        ],
+        "total_calories": round(float(servings @ candidates.calories[rows]) if len(rows) else 0.0, 2),
+        "remaining_gap": dict(zip(NUTRIENTS, np.round(gap, 2).tolist())),
+        "planned_intake": dict(zip(NUTRIENTS, np.round(planned, 2).tolist())),
+        "gap_covered_percent": dict(zip(NUTRIENTS, np.round(covered, 2).tolist())),
+    }
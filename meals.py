@@ -1,62 +1,151 @@
 from fastapi import APIRouter, HTTPException
-from pydantic import BaseModel
-from typing import Optional
-import json
-import os
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel, Field
+from typing import List, Optional
 from datetime import datetime
+import numpy as np
+
+from foodcatalog import NUTRIENTS, get_food_catalog
+from mealstore import catalog_nutrients, get_meal_store_async
+from metrics import span
 
 router = APIRouter()
 
-MEALS_PATH = os.path.join(os.path.dirname(__file__), "logged_meals.json")
-FOOD_CSV_PATH = os.path.join(os.path.dirname(__file__), "nepalifood.csv")
+MAX_FOOD_ID = np.iinfo(np.intp).max  # larger ids can't be catalog ids
+
+
+def valid_date(date):
+    try:
+        datetime.strptime(date, "%Y-%m-%d")
+        return True
+    except ValueError:
+        return False
 
 class MealLog(BaseModel):
     user_id: str
     food_id: int
+    amount_grams: Optional[float] = Field(None, gt=0)  # one catalog portion (100 g) if not given
     date: Optional[str] = None  # Defaults to today if not provided
 
 @router.post("/logmeal")
-def log_meal(meal: MealLog):
-    # Load food list to validate food_id
-    import pandas as pd
-    food_df = pd.read_csv(FOOD_CSV_PATH)
-    food_row = food_df[food_df["food_id"] == meal.food_id]
-    if food_row.empty:
+async def log_meal(meal: MealLog):
+    # Validate food_id against the shared catalog (reloads parse the CSV,
+    # so not on the event loop)
+    catalog = await run_in_threadpool(get_food_catalog)
+    row = catalog.row_for_id(meal.food_id)
+    if row < 0:
         raise HTTPException(status_code=404, detail="Food ID not found")
 
-    food_name = food_row.iloc[0]["food_name"]
+    food_name = str(catalog.food_names[row])
 
     # Set date to today if not provided
     if not meal.date:
         meal.date = datetime.today().strftime("%Y-%m-%d")
+    elif not valid_date(meal.date):
+        raise HTTPException(status_code=400, detail=f"Invalid date: {meal.date}")
 
-    # Load current logs
-    if os.path.exists(MEALS_PATH):
-        with open(MEALS_PATH, "r", encoding="utf-8") as f:
-            logs = json.load(f)
-    else:
-        logs = []
-
-    # Append new log
-    logs.append({
+    # Append new log entry (one JSON line, no full-file rewrite); the
+    # nutrients go into the user's running total for that day
+    entry = {
         "user_id": meal.user_id,
         "food_id": meal.food_id,
         "food_name": food_name,
         "date": meal.date,
-    })
+        "nutrients": catalog_nutrients(catalog, row, meal.amount_grams),
+    }
+    if meal.amount_grams is not None:
+        entry["amount_grams"] = meal.amount_grams
+    with span("file_io", router="meals"):
+        store = await get_meal_store_async()
+        (entry,) = await store.append_many_async([entry])
 
-    # Save updated log
-    with open(MEALS_PATH, "w", encoding="utf-8") as f:
-        json.dump(logs, f, indent=2)
+    return {"message": "Meal logged successfully", "entry_id": entry["entry_id"]}
 
-    return {"message": "Meal logged successfully"}
+class BulkMealEntry(BaseModel):
+    food_id: Optional[int] = None
+    food_name: Optional[str] = None
+    amount_grams: Optional[float] = Field(None, gt=0)  # catalog values are per 100 g
+    date: Optional[str] = None  # Defaults to today if not provided
+    meal_slot: Optional[str] = None
 
-@router.get("/logmeal/{user_id}")
-def get_logged_meals(user_id: str):
-    if not os.path.exists(MEALS_PATH):
-        return []
+class BulkMealLog(BaseModel):
+    user_id: str
+    entries: List[BulkMealEntry] = Field(..., max_length=5000)
+
+@router.post("/logmeal/bulk")
+async def log_meals_bulk(request: BulkMealLog):
+    catalog = await run_in_threadpool(get_food_catalog)
+    entries = request.entries
+    today = datetime.today().strftime("%Y-%m-%d")
 
-    with open(MEALS_PATH, "r", encoding="utf-8") as f:
-        logs = json.load(f)
+    # Resolve every entry to a catalog row in one pass: ids through the
+    # row index, names through the lowercase name map
+    ids = np.array(
+        [e.food_id if e.food_id is not None and 0 <= e.food_id <= MAX_FOOD_ID else -1 for e in entries],
+        dtype=np.intp
+    )
+    rows = catalog.rows_for_ids(ids)
+    for i, e in enumerate(entries):
+        if e.food_id is None and e.food_name:
+            rows[i] = catalog.row_for_name(e.food_name)
+
+    # Portion-scaled nutrients for all entries at once (rows of unknown
+    # foods are computed but never stored)
+    grams = np.array([100.0 if e.amount_grams is None else e.amount_grams for e in entries])
+    vectors = catalog.matrix[rows] * (grams / 100)[:, None]
+
+    valid_dates = {}
+    results = []
+    accepted = []
+    for i, e in enumerate(entries):
+        date = e.date or today
+        if date not in valid_dates:
+            valid_dates[date] = valid_date(date)
+
+        if e.food_id is None and not e.food_name:
+            results.append({"index": i, "status": "error", "detail": "food_id or food_name is required"})
+        elif rows[i] < 0:
+            results.append({"index": i, "status": "error", "detail": "Food not found"})
+        elif not valid_dates[date]:
+            results.append({"index": i, "status": "error", "detail": f"Invalid date: {date}"})
+        else:
+            entry = {
+                "user_id": request.user_id,
+                "food_id": int(catalog.food_ids[rows[i]]),
+                "food_name": str(catalog.food_names[rows[i]]),
+                "date": date,
+                "nutrients": dict(zip(NUTRIENTS, vectors[i].tolist())),
+            }
+            if e.amount_grams is not None:
+                entry["amount_grams"] = e.amount_grams
+            if e.meal_slot:
+                entry["meal_slot"] = e.meal_slot
+            accepted.append(entry)
+            results.append({"index": i, "status": "logged"})
+
+    # All valid entries go to the log in a single append
+    with span("file_io", router="meals_bulk"):
+        store = await get_meal_store_async()
+        stored = await store.append_many_async(accepted) if accepted else []
+    for result, entry in zip((r for r in results if r["status"] == "logged"), stored):
+        result["entry_id"] = entry["entry_id"]
+
+    return {
+        "logged": len(accepted),
+        "failed": len(entries) - len(accepted),
+        "results": results,
+    }
+
+@router.get("/logmeal/{user_id}")
+async def get_logged_meals(user_id: str):
+    return (await get_meal_store_async()).meals_for_user(user_id)
 
-    return [log for log in logs if log["user_id"] == user_id]
+@router.delete("/logmeal/{user_id}/{entry_id}")
+async def delete_logged_meal(user_id: str, entry_id: str):
+    # Undo a logged meal; its nutrients are subtracted from the day's total
+    store = await get_meal_store_async()
+    entry = store.get(entry_id)
+    if entry is None or entry["user_id"] != user_id:
+        raise HTTPException(status_code=404, detail="Meal entry not found")
+    await store.delete_async(entry_id)
+    return {"message": "Meal deleted", "entry": entry}
@@ -0,0 +1,545 @@
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import threading
+import uuid
+
+import numpy as np
+
+from foodcatalog import NUTRIENTS, get_food_catalog
+from metrics import span
+from persistence import append_file, terminate_partial_line, write_atomic, writer
+from registry import registry
+from snapshot import SNAPSHOT_DIR, Snapshot, write_snapshot
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+MEALS_LOG_PATH = os.path.join(BASE_DIR, "logged_meals.jsonl")
+LEGACY_MEALS_PATH = os.path.join(BASE_DIR, "logged_meals.json")
+MEAL_TOTALS_PATH = os.path.join(BASE_DIR, "logged_meals.totals.json")
+MEALS_SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "logged_meals")
+
+CHECKPOINT_EVERY = 100  # log writes between accumulator checkpoints
+
+# Snapshot layout token for a nutrients dict held in the vectors array
+MATRIX_NUTRIENTS = "*nutrients"
+
+
+def catalog_nutrients(catalog, row, amount_grams=None):
+    # Nutrient vector of one catalog row (values per 100 g), as stored on
+    # each log entry
+    vector = catalog.matrix[row]
+    if amount_grams is not None:
+        vector = vector * (amount_grams / 100)
+    return dict(zip(NUTRIENTS, vector.tolist()))
+
+
+def food_nutrients(food_id):
+    # For log entries written before entries carried their own nutrients
+    catalog = get_food_catalog()
+    row = catalog.row_for_id(food_id)
+    return catalog_nutrients(catalog, row) if row >= 0 else {}
+
+
+def entry_vector(entry):
+    nutrients = entry.get("nutrients") or {}
+    return np.array([nutrients.get(n, 0) for n in NUTRIENTS], dtype=np.float64)
+
+
+# Append-only JSON Lines meal log with an in-memory (user_id, date) index and
+# a running nutrient total per (user_id, date). Deletes are tombstone lines.
+# The totals are checkpointed next to the log together with the log offset
+# they cover, so a restart only has to add up entries written after it: in
+# full at load and shutdown, and in between as journal lines holding only
+# the totals that changed.
+# compile_snapshot() writes the live entries as a columnar snapshot (see
+# snapshot.py); a restart restores those without parsing their JSON lines.
+# Memory follows the log file, not this process's writes: several worker
+# processes can share one log, and refresh() picks up the others' entries.
+# The read accessors only ever look at memory.
+class MealStore:
+    def __init__(self, log_path, legacy_path=None, totals_path=None, nutrients_for=None, snapshot_path=None):
+        self.log_path = log_path
+        self.legacy_path = legacy_path
+        self.totals_path = totals_path
+        self.journal_path = totals_path + ".journal" if totals_path else None
+        self.snapshot_path = snapshot_path
+        self.nutrients_for = nutrients_for
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._by_user = {}
+        self._by_user_date = {}
+        self._totals = {}
+        self._size = 0
+        self._lines = 0
+        self._digest = hashlib.sha1()
+        self._unsaved = 0
+        self._dirty = set()  # keys whose total changed since the last checkpoint
+        self._checkpoint_offset = 0
+        self._base_stale = False  # totals not reachable from the checkpoint files
+        self._load()
+
+    def _load(self):
+        # One-time migration from the old pretty-printed JSON array
+        if not os.path.exists(self.log_path) and self.legacy_path and os.path.exists(self.legacy_path):
+            with open(self.legacy_path, "r", encoding="utf-8") as f:
+                legacy = json.load(f)
+            data = "".join(json.dumps(entry) + "\n" for entry in legacy)
+            write_atomic(self.log_path, data.encode("utf-8"), writer.fsync)
+
+        if not os.path.exists(self.log_path):
+            return
+
+        with span("file_io", target="meal_log"), open(self.log_path, "rb") as f:
+            data = f.read()
+
+        # A partial last line is another worker's append in flight or what a
+        # crash left. Only complete lines are read here; catch-up reads the
+        # rest. A crash remnant is terminated so the next append starts on a
+        # fresh line, which is only safe while no append holds the lock.
+        if data and not data.endswith(b"\n"):
+            terminate_partial_line(self.log_path)
+            data = data[:data.rfind(b"\n") + 1]
+
+        offset, totals = self._read_checkpoint(data)
+        position, first_line, snapshot_totals = self._read_snapshot(data)
+        if position > offset:  # checkpoint older than the snapshot
+            offset, totals = position, snapshot_totals
+            self._base_stale = True
+        self._totals = totals
+        self._checkpoint_offset = offset
+
+        for line_number, line in enumerate(data[position:].splitlines(keepends=True), first_line):
+            start = position
+            position += len(line)
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except json.JSONDecodeError:
+                continue
+            self._apply(record, accumulate=start >= offset, line_number=line_number)
+
+        self._size = len(data)
+        self._lines = data.count(b"\n")
+        self._digest.update(data)
+        if offset < len(data):
+            self._unsaved = CHECKPOINT_EVERY  # checkpoint on the next write
+            self._base_stale = self._base_stale or offset == 0
+
+    def _read_checkpoint(self, data):
+        # (log offset, totals) from the full checkpoint and the journal steps
+        # continuing it, as far as they still match the log
+        offset, totals, digest = 0, {}, hashlib.sha1()
+        if not self.totals_path:
+            return offset, totals
+        try:
+            with open(self.totals_path, "r", encoding="utf-8") as f:
+                checkpoint = json.load(f)
+            prefix = hashlib.sha1(data[:checkpoint["offset"]])
+            if (
+                checkpoint["nutrients"] == NUTRIENTS
+                and checkpoint["offset"] <= len(data)
+                and prefix.hexdigest() == checkpoint["sha1"]
+            ):
+                offset, digest = checkpoint["offset"], prefix
+                totals = {
+                    (user_id, date): np.array(vector, dtype=np.float64)
+                    for user_id, date, vector in checkpoint["totals"]
+                }
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+
+        try:
+            with open(self.journal_path, "rb") as f:
+                steps = f.read().splitlines()
+        except OSError:
+            return offset, totals
+        # A step holds the totals changed between its base offset and its
+        # own. Steps that don't continue from the offset reached so far
+        # (written by another process, or before a newer full checkpoint)
+        # are skipped.
+        for line in steps:
+            try:
+                step = json.loads(line)
+                if (
+                    step["base"] != offset
+                    or step["nutrients"] != NUTRIENTS
+                    or not offset <= step["offset"] <= len(data)
+                ):
+                    continue
+                prefix = digest.copy()
+                prefix.update(data[offset:step["offset"]])
+                if prefix.hexdigest() != step["sha1"]:
+                    continue
+                changed = {
+                    (user_id, date): np.array(vector, dtype=np.float64)
+                    for user_id, date, vector in step["totals"]
+                }
+            except (ValueError, KeyError, TypeError):
+                continue  # partial last line after a crash
+            totals.update(changed)
+            offset, digest = step["offset"], prefix
+        return offset, totals
+
+    def _read_snapshot(self, data):
+        # Restores the entries of a snapshot compiled from a prefix of the
+        # log. -> (log offset, line number, day totals) to continue from.
+        snapshot = Snapshot.open(self.snapshot_path) if self.snapshot_path else None
+        if snapshot is None:
+            return 0, 0, {}
+        meta = snapshot.meta
+        if (
+            meta["nutrients"] != NUTRIENTS
+            or meta["offset"] > len(data)
+            or hashlib.sha1(data[:meta["offset"]]).hexdigest() != meta["sha1"]
+        ):
+            return 0, 0, {}
+        if not meta["fields"]:  # nothing was live
+            return meta["offset"], meta["lines"], {}
+
+        vectors = snapshot.array("vectors")
+        layout_codes = snapshot.codes("layout")
+        fields = {key: snapshot.decode(f"field.{key}") for key in meta["fields"]}
+        entries = [None] * len(layout_codes)
+        # Entries sharing a key layout are built column-wise
+        for layout_id, keys in enumerate(json.loads(k) for k in snapshot.dictionary("layout")):
+            rows = np.flatnonzero(layout_codes == layout_id)
+            columns = [
+                [dict(zip(NUTRIENTS, v)) for v in vectors[rows].tolist()] if key == MATRIX_NUTRIENTS
+                else fields[key][rows].tolist()
+                for key in keys
+            ]
+            keys = ["nutrients" if key == MATRIX_NUTRIENTS else key for key in keys]
+            for row, values in zip(rows.tolist(), zip(*columns)):
+                entries[row] = dict(zip(keys, values))
+        for entry in entries:
+            self._apply(entry, accumulate=False)
+
+        # Day totals straight from the vectors, grouped by (user_id, date) codes
+        users, dates = snapshot.codes("field.user_id"), snapshot.codes("field.date")
+        groups, inverse = np.unique(
+            users.astype(np.int64) * (int(dates.max(initial=0)) + 1) + dates, return_inverse=True
+        )
+        sums = np.zeros((len(groups), len(NUTRIENTS)))
+        np.add.at(sums, inverse, vectors)
+        first = np.zeros(len(groups), dtype=np.intp)
+        first[inverse[::-1]] = np.arange(len(inverse))[::-1]
+        totals = {
+            (entries[row]["user_id"], entries[row]["date"]): total
+            for row, total in zip(first.tolist(), sums)
+        }
+        return meta["offset"], meta["lines"], totals
+
+    def compile_snapshot(self):
+        # Live entries (deleted ones dropped) in log order. Values are stored
+        # per key as dictionary-encoded JSON; each entry's key order is kept
+        # as a dictionary-encoded layout.
+        self.refresh()
+        with self._lock:
+            entries = list(self._entries.values())
+            meta = {
+                "offset": self._size,
+                "lines": self._lines,
+                "sha1": self._digest.hexdigest(),
+                "nutrients": NUTRIENTS,
+            }
+
+        vectors = np.zeros((len(entries), len(NUTRIENTS)))
+        layouts, fields = [], {}
+        for i, entry in enumerate(entries):
+            keys = []
+            for key, value in entry.items():
+                if key == "nutrients" and list(value) == NUTRIENTS \
+                        and all(type(v) is float for v in value.values()):
+                    keys.append(MATRIX_NUTRIENTS)
+                    continue
+                keys.append(key)
+                if key not in fields:
+                    fields[key] = [None] * len(entries)
+                fields[key][i] = value
+            vectors[i] = entry_vector(entry)
+            layouts.append(json.dumps(keys))
+
+        meta["fields"] = list(fields)
+        with span("file_io", target="meal_snapshot"):
+            write_snapshot(
+                self.snapshot_path, meta,
+                arrays={"vectors": vectors},
+                strings={"layout": layouts},
+                values={f"field.{key}": values for key, values in fields.items()},
+            )
+        return len(entries)
+
+    def _apply(self, record, accumulate=True, line_number=None):
+        if record.get("op") == "delete":
+            entry = self._entries.pop(record["entry_id"], None)
+            if entry is None:
+                return None
+            key = (entry["user_id"], entry["date"])
+            self._by_user[entry["user_id"]].remove(entry)
+            self._by_user_date[key].remove(entry)
+            if accumulate:
+                self._totals[key] = self._totals.get(key, 0) - entry_vector(entry)
+                self._dirty.add(key)
+            return entry
+
+        # Entries from before ids / nutrient vectors were stored
+        if "entry_id" not in record:
+            record["entry_id"] = f"line-{line_number}"
+        if "nutrients" not in record and self.nutrients_for is not None:
+            record["nutrients"] = self.nutrients_for(record["food_id"])
+
+        key = (record["user_id"], record["date"])
+        self._entries[record["entry_id"]] = record
+        self._by_user.setdefault(record["user_id"], []).append(record)
+        self._by_user_date.setdefault(key, []).append(record)
+        if accumulate:
+            self._totals[key] = self._totals.get(key, 0) + entry_vector(record)
+            self._dirty.add(key)
+        return record
+
+    def _write(self, records):
+        # One append (and one write call) for any number of records. With the
+        # async writer running the data is queued behind earlier writes and
+        # the returned future resolves once it is on disk.
+        data = "".join(json.dumps(record) + "\n" for record in records).encode("utf-8")
+        if writer.running:
+            return writer.submit("append", self.log_path, data)
+        with span("file_io", target="meal_log"):
+            append_file(self.log_path, data, fsync=False)
+        return None
+
+    def refresh(self):
+        # Every worker process appends to the same log: pick up lines written
+        # by the others (once per request, before reading from memory)
+        try:
+            size = os.path.getsize(self.log_path)
+        except OSError:
+            return
+        if size > self._size:
+            self._catch_up()
+
+    def _catch_up(self):
+        # Applies the complete lines appended to the log since it was last
+        # read, in file order. Memory only ever reflects what is on disk, so
+        # a failed write leaves nothing to roll back.
+        with self._lock:
+            try:
+                with span("file_io", target="meal_log"), open(self.log_path, "rb") as f:
+                    f.seek(self._size)
+                    data = f.read()
+            except FileNotFoundError:
+                return
+            data = data[:data.rfind(b"\n") + 1]
+            for line in data.splitlines():
+                line_number = self._lines
+                self._lines += 1
+                try:
+                    record = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                self._apply(record, line_number=line_number)
+                self._unsaved += 1
+            self._size += len(data)
+            self._digest.update(data)
+            self._maybe_checkpoint()
+
+    def _maybe_checkpoint(self):
+        # Only once the written records are applied, so the checkpoint's
+        # totals always match its offset. Totals the checkpoint files can't
+        # reach wait for the next full checkpoint.
+        if self._unsaved >= CHECKPOINT_EVERY and not self._base_stale:
+            self._save_checkpoint(full=False)
+
+    def _save_checkpoint(self, full=True):
+        # full: every total, replacing the checkpoint and emptying the
+        # journal. Otherwise one journal step with the changed totals only.
+        if not self.totals_path:
+            return
+        keys = self._totals if full else self._dirty
+        checkpoint = {
+            "offset": self._size,
+            "sha1": self._digest.hexdigest(),
+            "nutrients": NUTRIENTS,
+            "totals": [[user_id, date, self._totals[(user_id, date)].tolist()] for user_id, date in keys],
+        }
+        if full:
+            writes = [
+                ("replace", self.totals_path, json.dumps(checkpoint).encode("utf-8")),
+                ("replace", self.journal_path, b""),
+            ]
+        else:
+            checkpoint["base"] = self._checkpoint_offset
+            writes = [("append", self.journal_path, (json.dumps(checkpoint) + "\n").encode("utf-8"))]
+        # Queued after the log lines it covers, so it never gets ahead of them.
+        # A lost checkpoint only means a longer replay on the next load, so
+        # failures are logged, not raised; a failed direct write is retried
+        # by the next checkpoint.
+        for op, path, data in writes:
+            if writer.running:
+                writer.submit(op, path, data).add_done_callback(_log_checkpoint_failure)
+                continue
+            try:
+                if op == "replace":
+                    write_atomic(path, data, writer.fsync)
+                else:
+                    append_file(path, data, fsync=False)
+            except OSError:
+                logger.exception("Meal totals checkpoint to %s failed", path)
+                return
+        self._checkpoint_offset = self._size
+        self._dirty = set()
+        self._unsaved = 0
+        self._base_stale = self._base_stale and not full
+
+    def _append(self, entries):
+        entries = [{"entry_id": uuid.uuid4().hex, **entry} for entry in entries]
+        return entries, self._write(entries)
+
+    def _delete(self, entry_id):
+        self.refresh()
+        entry = self._entries.get(entry_id)
+        if entry is None:
+            return None, None
+        return entry, self._write([{"op": "delete", "entry_id": entry_id}])
+
+    # The write calls return once the write is durable and applied in
+    # memory; readers never see a write that isn't on disk. The *_async
+    # variants are for handlers running on the event loop.
+    def append(self, entry):
+        return self.append_many([entry])[0]
+
+    def append_many(self, entries):
+        entries, future = self._append(entries)
+        if future is not None:
+            future.result()
+        self._catch_up()
+        return entries
+
+    async def append_many_async(self, entries):
+        entries, future = await asyncio.to_thread(self._append, entries)
+        if future is not None:
+            await asyncio.wrap_future(future)
+        await asyncio.to_thread(self._catch_up)
+        return entries
+
+    def delete(self, entry_id):
+        entry, future = self._delete(entry_id)
+        if future is not None:
+            future.result()
+        if entry is not None:
+            self._catch_up()
+        return entry
+
+    async def delete_async(self, entry_id):
+        entry, future = await asyncio.to_thread(self._delete, entry_id)
+        if future is not None:
+            await asyncio.wrap_future(future)
+        if entry is not None:
+            await asyncio.to_thread(self._catch_up)
+        return entry
+
+    def checkpoint(self):
+        with self._lock:
+            if self._unsaved or self._base_stale:
+                self._save_checkpoint()
+
+    def rebuild_totals(self):
+        # Recompute every accumulator from the live entries and replace the
+        # running ones. Returns the keys whose running total had drifted.
+        with self._lock:
+            totals = {}
+            for key, entries in self._by_user_date.items():
+                if entries:
+                    totals[key] = np.sum([entry_vector(e) for e in entries], axis=0)
+            mismatched = [
+                key for key in set(totals) | set(self._totals)
+                if not np.allclose(totals.get(key, 0), self._totals.get(key, 0))
+            ]
+            self._totals = totals
+            self._save_checkpoint()
+        return sorted(mismatched)
+
+    def get(self, entry_id):
+        return self._entries.get(entry_id)
+
+    def meals_for_user(self, user_id):
+        return list(self._by_user.get(user_id, ()))
+
+    def meals_for_day(self, user_id, date):
+        return list(self._by_user_date.get((user_id, date), ()))
+
+    def meal_count(self, user_id, date):
+        return len(self._by_user_date.get((user_id, date), ()))
+
+    def day_totals(self, user_id, date):
+        # Running nutrient vector in NUTRIENTS order (zeros for no meals)
+        totals = self._totals.get((user_id, date))
+        if totals is None:
+            return np.zeros(len(NUTRIENTS))
+        return np.maximum(totals, 0)  # no negative drift after deletes
+
+
+def _log_checkpoint_failure(future):
+    error = future.exception()
+    if error is not None:
+        logger.error("Meal totals checkpoint write failed: %s", error)
+
+
+def _load_meal_store():
+    store = MealStore(
+        MEALS_LOG_PATH, LEGACY_MEALS_PATH, MEAL_TOTALS_PATH,
+        nutrients_for=food_nutrients, snapshot_path=MEALS_SNAPSHOT_PATH
+    )
+    # Full checkpoint while still loading, so writes only ever append steps
+    store.checkpoint()
+    return store
+
+
+registry.register("meal_store", _load_meal_store)
+
+
+def get_meal_store():
+    return registry.get("meal_store")
+
+
+def get_current_meal_store():
+    # Loaded and caught up with the other workers' appends
+    store = get_meal_store()
+    store.refresh()
+    return store
+
+
+async def get_meal_store_async():
+    # Once per request: the first load replays the whole log and a refresh
+    # reads the new lines, so neither runs on the event loop
+    return await asyncio.to_thread(get_current_meal_store)
+
+
+def compile_meal_snapshot():
+    store = get_meal_store()
+    return store.snapshot_path, store.compile_snapshot()
+
+
+if __name__ == "__main__":
+    # Recompute the per-day accumulators from the raw log:
+    #   python mealstore.py          rebuild and rewrite the checkpoint
+    #   python mealstore.py --check  only report accumulators that drifted
+    import sys
+
+    store = MealStore(
+        MEALS_LOG_PATH, LEGACY_MEALS_PATH, MEAL_TOTALS_PATH,
+        nutrients_for=food_nutrients, snapshot_path=MEALS_SNAPSHOT_PATH
+    )
+    if "--check" in sys.argv:
+        store.totals_path = None  # don't rewrite the checkpoint
+    mismatched = store.rebuild_totals()
+    print(f"{len(store._totals)} day totals, {len(mismatched)} out of sync")
+    for user_id, date in mismatched:
+        print(f"  {user_id} {date}")
+    sys.exit(1 if mismatched and "--check" in sys.argv else 0)
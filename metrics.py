@@ -0,0 +1,289 @@
+import bisect
+import hmac
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import parse_qs
+
+# Latency buckets (seconds) shared by request and span histograms
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Off by default: a profile exposes stack frames and source paths
+PROFILING_ENABLED = os.environ.get("MAMACARE_PROFILING", "0") == "1"
+# If set, profiled requests must also send it as an X-Profile-Token header
+PROFILE_TOKEN = os.environ.get("MAMACARE_PROFILE_TOKEN")
+# Only requests without side effects are answered with a profile
+PROFILE_METHODS = ("GET", "HEAD")
+PROFILE_INTERVAL = float(os.environ.get("MAMACARE_PROFILE_INTERVAL_MS", "1")) / 1000
+PROFILE_TOP = 40
+
+
+class Histogram:
+    __slots__ = ("counts", "sum", "count")
+
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)  # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+def _labels(labels):
+    if not labels:
+        return ""
+    escaped = (
+        (k, str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n"))
+        for k, v in labels
+    )
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+# Process-wide request/span histograms and counters in Prometheus text format.
+# Modules can add gauges computed at scrape time with add_collector().
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {}  # (name, labels) -> Histogram
+        self._counters = {}    # (name, labels) -> value
+        self._help = {}
+        self._collectors = []
+
+    def describe(self, name, text):
+        self._help[name] = text
+
+    def observe(self, name, labels, seconds):
+        key = (name, labels)
+        with self._lock:
+            histogram = self._histograms.get(key)
+            if histogram is None:
+                histogram = self._histograms[key] = Histogram()
+            histogram.observe(seconds)
+
+    def inc(self, name, labels, value=1):
+        key = (name, labels)
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def add_collector(self, fn):
+        # fn() -> iterable of (name, labels tuple, value), exposed as gauges
+        self._collectors.append(fn)
+
+    def add_cache(self, name, cache):
+        # Size / hit / miss gauges for anything with an LRUCache-style stats()
+        def collect():
+            stats = cache.stats()
+            for key in ("size", "hits", "misses"):
+                yield f"mamacare_cache_{key}", (("cache", name),), stats[key]
+        self.add_collector(collect)
+
+    @contextmanager
+    def span(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(
+                "mamacare_span_seconds",
+                (("span", name),) + tuple(sorted(labels.items())),
+                time.perf_counter() - start
+            )
+
+    def render(self):
+        lines = []
+        with self._lock:
+            histograms = sorted(self._histograms.items())
+            counters = sorted(self._counters.items())
+
+        seen = set()
+        def header(name, kind):
+            if name not in seen:
+                seen.add(name)
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), histogram in histograms:
+            header(name, "histogram")
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ("+Inf",), histogram.counts):
+                cumulative += count
+                lines.append(f"{name}_bucket{_labels(labels + (('le', bound),))} {cumulative}")
+            lines.append(f"{name}_sum{_labels(labels)} {histogram.sum}")
+            lines.append(f"{name}_count{_labels(labels)} {histogram.count}")
+
+        for (name, labels), value in counters:
+            header(name, "counter")
+            lines.append(f"{name}{_labels(labels)} {value}")
+
+        # Samples of one metric have to be contiguous in the exposition
+        gauges = {}
+        for collector in self._collectors:
+            for name, labels, value in collector():
+                gauges.setdefault(name, []).append((labels, value))
+        for name, samples in gauges.items():
+            header(name, "gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {value}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = Metrics()
+metrics.describe("mamacare_http_request_duration_seconds", "Request latency by route template")
+metrics.describe("mamacare_http_requests_total", "Requests by route template and status")
+metrics.describe("mamacare_span_seconds", "Time spent in instrumented hot paths")
+
+span = metrics.span
+
+
+# Samples every thread's stack (sys._current_frames) at a fixed interval, so
+# sync handlers running in the threadpool are seen as well
+class SamplingProfiler:
+    def __init__(self, interval=PROFILE_INTERVAL):
+        self.interval = interval
+        self.samples = 0
+        self._self = {}
+        self._total = {}
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _sample(self):
+        own = threading.get_ident()
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_firstlineno} {code.co_name}")
+                frame = frame.f_back
+            # Idle worker / event-loop threads sit in a wait call
+            if stack[0].split(" ")[-1] in ("wait", "select", "_worker", "get"):
+                continue
+            self.samples += 1
+            self._self[stack[0]] = self._self.get(stack[0], 0) + 1
+            for function in set(stack):
+                self._total[function] = self._total.get(function, 0) + 1
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self._sample()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="mamacare-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def report(self, top=PROFILE_TOP):
+        samples = self.samples or 1
+        ranked = sorted(self._total.items(), key=lambda item: -item[1])[:top]
+        return {
+            "samples": self.samples,
+            "interval_ms": self.interval * 1000,
+            "functions": [
+                {
+                    "function": function,
+                    "total_pct": round(100 * total / samples, 1),
+                    "self_pct": round(100 * self._self.get(function, 0) / samples, 1),
+                }
+                for function, total in ranked
+            ],
+        }
+
+
+_profile_lock = threading.Lock()
+
+
+# ASGI middleware: per-route latency histogram and status counter, labelled
+# by the matched route template (not the raw path). With profiling enabled,
+# a GET request with ?profile=1 is run under the sampling profiler and
+# answered with the profile instead of its normal body.
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        if self._wants_profile(scope):
+            await self._profiled(scope, receive, send)
+            return
+
+        status = 500
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        start = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            self._record(scope, status, time.perf_counter() - start)
+
+    def _wants_profile(self, scope):
+        if not PROFILING_ENABLED or scope["method"] not in PROFILE_METHODS \
+                or b"profile=1" not in scope.get("query_string", b""):
+            return False
+        if parse_qs(scope["query_string"].decode()).get("profile") != ["1"]:
+            return False
+        if PROFILE_TOKEN is None:
+            return True
+        token = dict(scope["headers"]).get(b"x-profile-token", b"")
+        return hmac.compare_digest(token, PROFILE_TOKEN.encode("utf-8"))
+
+    def _record(self, scope, status, seconds):
+        route = scope.get("route")
+        route = getattr(route, "path", None) or "<unmatched>"
+        metrics.observe("mamacare_http_request_duration_seconds", (("method", scope["method"]), ("route", route)), seconds)
+        metrics.inc("mamacare_http_requests_total", (("method", scope["method"]), ("route", route), ("status", str(status))))
+
+    async def _profiled(self, scope, receive, send):
+        # One profiled request at a time; the sampler sees every thread
+        if not _profile_lock.acquire(blocking=False):
+            body = b'{"detail":"Another request is being profiled"}'
+            await send({"type": "http.response.start", "status": 409,
+                        "headers": [(b"content-type", b"application/json")]})
+            await send({"type": "http.response.body", "body": body})
+            return
+
+        status = 500
+        async def capture(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+
+        profiler = SamplingProfiler()
+        start = time.perf_counter()
+        profiler.start()
+        try:
+            await self.app(scope, receive, capture)
+        finally:
+            profiler.stop()
+            _profile_lock.release()
+        seconds = time.perf_counter() - start
+        self._record(scope, status, seconds)
+
+        route = getattr(scope.get("route"), "path", None)
+        body = json.dumps({
+            "route": route,
+            "path": scope["path"],
+            "status": status,
+            "seconds": round(seconds, 6),
+            **profiler.report(),
+        }).encode("utf-8")
+        await send({"type": "http.response.start", "status": 200,
+                    "headers": [(b"content-type", b"application/json")]})
+        await send({"type": "http.response.body", "body": body})
@@ -1,14 +1,16 @@
 from fastapi import APIRouter, HTTPException, Query
-import pandas as pd
-import json
-import os
+from fastapi.concurrency import run_in_threadpool
+from datetime import datetime, timedelta
+from typing import Optional
+import numpy as np
 
-router = APIRouter()
+from foodcatalog import NUTRIENTS as TOTAL_NUTRIENTS
+from mealstore import get_meal_store_async
+from metrics import span
+from profiles import get_profile_store
+from thresholds import get_threshold_compiler
 
-MEALS_PATH = os.path.join(os.path.dirname(__file__), "logged_meals.json")
-FOOD_PATH = os.path.join(os.path.dirname(__file__), "nepalifood.csv")
-USERS_PATH = os.path.join(os.path.dirname(__file__), "user_profiles.json")
-THRESHOLD_PATH = os.path.join(os.path.dirname(__file__), "threshold.json")
+router = APIRouter()
 
 # Nutrients tracked in your food CSV and user intake
 nutrients = [
@@ -16,89 +18,107 @@ nutrients = [
     "vitaminA", "vitaminC", "folate", "iodine"
 ]
 
-# Map simplified names to those used in threshold.json
-key_mapping = {
-    "protein": "protein_g",
-    "fat": "fat_g",
-    "carbs": "carbs_g",
-    "iron": "iron_mg",
-    "calcium": "calcium_mg",
-    "vitaminA": "vitamin_a_mcg",
-    "vitaminC": "vitamin_c_mg",
-    "folate": "folic_acid_mcg",
-    "iodine": "iodine_mcg"
-}
+
+# Positions of the nutrients above in the meal store's running totals
+TOTAL_COLUMNS = [TOTAL_NUTRIENTS.index(n) for n in nutrients]
+
+MAX_RANGE_DAYS = 366
+
+
+def _parse_day(value, name):
+    try:
+        return datetime.strptime(value, "%Y-%m-%d").date()
+    except ValueError:
+        raise HTTPException(status_code=400, detail=f"Invalid {name} date: {value}")
+
+
+def _date_range(start, end):
+    start_day = _parse_day(start, "start")
+    end_day = _parse_day(end, "end")
+    if end_day < start_day:
+        raise HTTPException(status_code=400, detail="end must not be before start")
+    n_days = (end_day - start_day).days + 1
+    if n_days > MAX_RANGE_DAYS:
+        raise HTTPException(status_code=400, detail=f"Date range is limited to {MAX_RANGE_DAYS} days")
+    return [(start_day + timedelta(days=i)).isoformat() for i in range(n_days)]
+
+
+def _load_user(user_id):
+    # Profile / threshold reloads read files, so this runs in the threadpool
+    return get_profile_store("maternal").get(user_id), get_threshold_compiler()
+
+
+def daily_totals(store, user_id, days):
+    # (days x nutrients) intake matrix read from the store's running totals
+    return np.array([store.day_totals(user_id, day)[TOTAL_COLUMNS] for day in days])
+
+
+def intake_percentages(totals, required):
+    with np.errstate(divide="ignore", invalid="ignore"):
+        percentages = np.round(totals / required * 100, 2)
+    percentages[..., required == 0] = 0
+    return np.minimum(percentages, 999.0)
 
 
 @router.get("/nutrientsummary/{user_id}")
-def nutrient_summary(user_id: str, date: str = Query(...)):
+async def nutrient_summary(
+    user_id: str,
+    date: Optional[str] = Query(None),
+    start: Optional[str] = Query(None),
+    end: Optional[str] = Query(None),
+):
+    if date is None and (start is None or end is None):
+        raise HTTPException(status_code=422, detail="Provide either date or both start and end")
+
     # Load all data
     try:
-        food_df = pd.read_csv(FOOD_PATH)
-        with open(MEALS_PATH, "r", encoding="utf-8") as f:
-            meals = json.load(f)
-        with open(USERS_PATH, "r", encoding="utf-8") as f:
-            users = json.load(f)
-        with open(THRESHOLD_PATH, "r", encoding="utf-8") as f:
-            thresholds = json.load(f)["nutrient_thresholds"]
+        user, thresholds = await run_in_threadpool(_load_user, user_id)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error loading data: {e}")
 
     # Get user
-    user = next((u for u in users if u["user_id"] == user_id), None)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # Get meals logged on that date
-    meals_today = [m for m in meals if m["user_id"] == user_id and m["date"] == date]
-    if not meals_today:
+    store = await get_meal_store_async()
+    days = [date] if date is not None else _date_range(start, end)
+    meal_counts = [store.meal_count(user_id, day) for day in days]
+    if date is not None and not meal_counts[0]:
         return {"message": "No meals logged for this date", "intake": {}, "percentages": {}}
 
-    # Sum up nutrient intake
-    total_intake = {k: 0.0 for k in nutrients}
-    for meal in meals_today:
-        food_row = food_df[food_df["food_id"] == meal["food_id"]]
-        if food_row.empty:
-            continue
-        row = food_row.iloc[0]
-        for nutrient in nutrients:
-            total_intake[nutrient] += row[nutrient]
-
-    # Build threshold for user's stage and preconditions
-    base_thresh = thresholds.get(user["stage"].lower(), {})
-    combined_threshold = {}
-
-    # Start with stage thresholds
-    for k, v in key_mapping.items():
-        combined_threshold[k] = base_thresh.get(v, 0)
-
-    # Merge with conditions (take max of each)
-    for condition, present in user["preconditions"].items():
-        if present:
-            cond_thresh = thresholds.get(condition.lower(), {})
-            for k, v in key_mapping.items():
-                combined_threshold[k] = max(
-                    combined_threshold.get(k, 0),
-                    cond_thresh.get(v, 0)
-                )
-
-    # Calculate % of required nutrients consumed
-    percentage_intake = {}
-    for n in nutrients:
-        required = combined_threshold.get(n, 0)
-        consumed = total_intake.get(n, 0)
-        if required == 0:
-            percentage = 0
-        else:
-            percentage = round((consumed / required) * 100, 2)
-        percentage_intake[n] = min(percentage, 999.0)
+    # Precompiled threshold for user's stage and preconditions
+    with span("threshold_merge", router="nutritionintake"):
+        required = thresholds.for_user(user)[thresholds.columns(nutrients)]
+    threshold = dict(zip(nutrients, required.tolist()))
+
+    # Running intake totals and % of required nutrients consumed
+    with span("intake_totals", router="nutritionintake"):
+        totals = daily_totals(store, user_id, days)
+    percentages = intake_percentages(totals, required)
+
+    if date is not None:
+        return {
+            "date": date,
+            "user_id": user_id,
+            "intake": dict(zip(nutrients, totals[0].tolist())),
+            "threshold": threshold,
+            "percentages": dict(zip(nutrients, percentages[0].tolist()))
+        }
 
     return {
-        "date": date,
         "user_id": user_id,
-        "intake": total_intake,
-        "threshold": {n: combined_threshold.get(n, 0) for n in nutrients},
-        "percentages": percentage_intake
+        "start": days[0],
+        "end": days[-1],
+        "threshold": threshold,
+        "days": [
+            {
+                "date": day,
+                "meals": count,
+                "intake": dict(zip(nutrients, day_totals.tolist())),
+                "percentages": dict(zip(nutrients, day_percentages.tolist()))
+            }
+            for day, count, day_totals, day_percentages in zip(days, meal_counts, totals, percentages)
+        ]
     }
 
 
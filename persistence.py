@@ -0,0 +1,151 @@
+import asyncio
+import concurrent.futures
+import fcntl
+import os
+import uuid
+
+from metrics import span
+
+
+def write_atomic(path, data, fsync=True):
+    # Replace a file's contents without readers ever seeing a partial file.
+    # The temp name is unique per write: worker processes replacing the same
+    # file never write into one shared temp file.
+    tmp_path = f"{path}.{os.getpid()}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(tmp_path, "xb") as f:
+            f.write(data)
+            if fsync:
+                f.flush()
+                os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def append_file(path, data, fsync=True):
+    # Appenders hold a shared lock on the file while writing, so a process
+    # holding the exclusive lock knows no append is half-done
+    with open(path, "ab") as f:
+        fcntl.flock(f, fcntl.LOCK_SH)
+        f.write(data)
+        if fsync:
+            f.flush()
+            os.fsync(f.fileno())
+
+
+def terminate_partial_line(path):
+    # Ends a crash-truncated last line with a newline, so the next append
+    # starts on a line of its own. Does nothing (False) while another
+    # process holds the lock: the partial line may be its append in flight.
+    with open(path, "rb+") as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return False
+        size = f.seek(0, os.SEEK_END)
+        if size:
+            f.seek(size - 1)
+            if f.read(1) != b"\n":
+                f.write(b"\n")
+        return True
+
+
+# Single writer task for all persisted files. Callers (from any thread) queue
+# appends / atomic replaces with submit(); the task drains whatever is queued,
+# writes each file's appends with one write() and one fsync per batch (group
+# commit), and resolves every caller's future once its data is on disk.
+# Items are written in the order they were submitted.
+class AsyncFileWriter:
+    def __init__(self, fsync=True, max_batch=1000):
+        self.fsync = fsync
+        self.max_batch = max_batch
+        self.batches = 0
+        self.items = 0
+        self._loop = None
+        self._queue = None
+        self._task = None
+
+    @property
+    def running(self):
+        return self._task is not None and not self._task.done()
+
+    async def start(self):
+        if self.running:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue()
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        # Flushes everything submitted before the call
+        if not self.running:
+            return
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        await self._task
+        self._task = None
+
+    def submit(self, op, path, data):
+        # op is "append" or "replace". Returns a concurrent.futures.Future;
+        # await it with asyncio.wrap_future() or block on .result() from a
+        # worker thread (never from the event loop thread).
+        future = concurrent.futures.Future()
+        # call_soon_threadsafe keeps submission order across threads
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, (op, path, data, future))
+        return future
+
+    async def _run(self):
+        stopping = False
+        while not stopping:
+            batch = [await self._queue.get()]
+            while len(batch) < self.max_batch and not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+            stopping = None in batch
+            batch = [item for item in batch if item is not None]
+            if batch:
+                await asyncio.to_thread(self._commit, batch)
+
+    def _commit(self, batch):
+        pending = {}  # path -> appended chunks not yet written
+
+        def flush():
+            for path, chunks in pending.items():
+                append_file(path, b"".join(chunks), self.fsync)
+            pending.clear()
+
+        try:
+            with span("file_io", target="writer_batch"):
+                for op, path, data, _ in batch:
+                    if op == "append":
+                        pending.setdefault(path, []).append(data)
+                    else:
+                        flush()  # a replace never overtakes earlier appends
+                        write_atomic(path, data, self.fsync)
+                flush()
+        except Exception as e:
+            for *_, future in batch:
+                future.set_exception(e)
+            return
+
+        self.batches += 1
+        self.items += len(batch)
+        for *_, future in batch:
+            future.set_result(None)
+
+    def stats(self):
+        return {
+            "running": self.running,
+            "queued": self._queue.qsize() if self.running else 0,
+            "batches": self.batches,
+            "items": self.items,
+        }
+
+
+writer = AsyncFileWriter(
+    fsync=os.environ.get("MAMACARE_FSYNC", "1") == "1",
+    max_batch=int(os.environ.get("MAMACARE_WRITE_BATCH", "1000")),
+)
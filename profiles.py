@@ -0,0 +1,379 @@
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+from typing import Dict, Literal, Optional
+import asyncio
+import fcntl
+import itertools
+import json
+import os
+import threading
+import time
+
+from metrics import span
+from persistence import append_file, write_atomic, writer
+from registry import registry
+
+router = APIRouter()
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MATERNAL_PROFILES_PATH = os.path.join(BASE_DIR, "user_profiles.json")
+MEN_PROFILES_PATH = os.path.join(BASE_DIR, "user_profiles_no_score.json")
+
+# Journals are folded back into the JSON file at shutdown, and on load
+# once they hold this many ops
+COMPACT_AFTER = 1000
+
+
+# Compact profile record. Covers the fields of both profile files; anything
+# else is kept in `extra`. Supports dict-style reads so existing code that
+# does user["stage"] / user.get("preconditions") keeps working.
+class UserProfile:
+    FIELDS = (
+        "user_id", "stage", "region", "age",
+        "height", "weight", "BMI", "preconditions",
+        "weight_kg", "height_cm", "bmi", "diet", "diet_one_hot",
+        "exercise", "smoker", "sleep_hours",
+    )
+    __slots__ = FIELDS + ("extra",)
+
+    def __init__(self, data):
+        for field in self.FIELDS:
+            setattr(self, field, data.get(field))
+        self.extra = {k: v for k, v in data.items() if k not in self.FIELDS} or None
+
+    def __getitem__(self, key):
+        value = self.get(key)
+        if value is None:
+            raise KeyError(key)
+        return value
+
+    def get(self, key, default=None):
+        if key in self.FIELDS:
+            value = getattr(self, key)
+        else:
+            value = (self.extra or {}).get(key)
+        return default if value is None else value
+
+    def to_dict(self):
+        data = {f: getattr(self, f) for f in self.FIELDS if getattr(self, f) is not None}
+        if self.extra:
+            data.update(self.extra)
+        return data
+
+
+# user_id -> UserProfile index over a JSON array file plus an append-only
+# journal of puts/deletes, so writes never rewrite the whole array.
+# Reloads when either file is changed by someone else.
+class UserProfileStore:
+    def __init__(self, path, listeners=(), reload_interval=1.0):
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._listeners = listeners
+        self._pending = 0  # journal writes queued on the async writer
+        self._appended = 0  # bytes of our own journal writes not yet in _version
+        self._load()
+        if self._journal_ops >= COMPACT_AFTER:
+            self.compact()
+
+    def _stat(self):
+        def stat(p):
+            try:
+                s = os.stat(p)
+                return (s.st_mtime_ns, s.st_size)
+            except FileNotFoundError:
+                return None
+        return (stat(self.path), stat(self.journal_path))
+
+    def _load(self):
+        profiles = {}
+        journal_ops = 0
+        with span("file_io", target=os.path.basename(self.path)):
+            if os.path.exists(self.path):
+                with open(self.path, "r", encoding="utf-8") as f:
+                    for data in json.load(f):
+                        profiles[data["user_id"]] = UserProfile(data)
+            if os.path.exists(self.journal_path):
+                with open(self.journal_path, "r", encoding="utf-8") as f:
+                    for line in f:
+                        try:
+                            op = json.loads(line)
+                        except json.JSONDecodeError:
+                            continue  # partial last line after a crash
+                        journal_ops += 1
+                        if op["op"] == "put":
+                            profiles[op["profile"]["user_id"]] = UserProfile(op["profile"])
+                        elif op["op"] == "delete":
+                            profiles.pop(op["user_id"], None)
+        self._profiles = profiles
+        self._version = self._stat()
+        self._checked = time.monotonic()
+        self._journal_ops = journal_ops
+        self._appended = 0
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        # Our own queued writes would look like someone else's change
+        if self._pending or now - self._checked < self.reload_interval:
+            return
+        with self._lock:
+            self._checked = now
+            if self._stat() != self._version:
+                self._load()
+                if self._journal_ops >= COMPACT_AFTER:
+                    self.compact()
+
+    def _append(self, op):
+        data = (json.dumps(op) + "\n").encode("utf-8")
+        self._journal_ops += 1
+        if writer.running:
+            self._pending += 1
+            self._appended += len(data)
+            return writer.submit("append", self.journal_path, data)
+        with span("file_io", target="profile_journal"):
+            append_file(self.journal_path, data, fsync=False)
+        self._appended += len(data)
+        self._advance()
+        return None
+
+    def _advance(self):
+        # Take the files as seen after our own writes, unless the journal grew
+        # by more than we wrote: then someone else appended and the next
+        # check reloads
+        def size(v):
+            return v[1][1] if v[1] else 0
+        version = self._stat()
+        if version[0] == self._version[0] and size(version) == size(self._version) + self._appended:
+            self._version = version
+        self._appended = 0
+
+    def _written(self):
+        with self._lock:
+            self._pending -= 1
+            if not self._pending:
+                self._advance()
+
+    def _wait(self, future):
+        if future is not None:
+            try:
+                future.result()
+            finally:
+                self._written()
+
+    async def _wait_async(self, future):
+        if future is not None:
+            try:
+                await asyncio.wrap_future(future)
+            finally:
+                self._written()
+
+    def _notify(self, old, new):
+        for listener in self._listeners:
+            listener(old, new)
+
+    def get(self, user_id, default=None):
+        self._maybe_reload()
+        return self._profiles.get(user_id, default)
+
+    def __contains__(self, user_id):
+        return self.get(user_id) is not None
+
+    def __len__(self):
+        self._maybe_reload()
+        return len(self._profiles)
+
+    def all(self):
+        self._maybe_reload()
+        return list(self._profiles.values())
+
+    def page(self, offset, limit):
+        self._maybe_reload()
+        return list(itertools.islice(self._profiles.values(), offset, offset + limit))
+
+    def _put(self, data):
+        profile = UserProfile(data)
+        with self._lock:
+            future = self._append({"op": "put", "profile": profile.to_dict()})
+            old = self._profiles.get(profile.user_id)
+            self._profiles[profile.user_id] = profile
+        return profile, old, future
+
+    def _delete(self, user_id):
+        with self._lock:
+            old = self._profiles.get(user_id)
+            if old is None:
+                return None, None
+            future = self._append({"op": "delete", "user_id": user_id})
+            del self._profiles[user_id]
+        return old, future
+
+    def _restore(self, user_id, old):
+        # Undo the in-memory side of a journal write that failed
+        with self._lock:
+            if old is None:
+                self._profiles.pop(user_id, None)
+            else:
+                self._profiles[user_id] = old
+
+    def put(self, data):
+        profile, old, future = self._put(data)
+        try:
+            self._wait(future)
+        except Exception:
+            self._restore(profile.user_id, old)
+            raise
+        self._notify(old, profile)
+        return profile
+
+    async def put_async(self, data):
+        profile, old, future = self._put(data)
+        try:
+            await self._wait_async(future)
+        except Exception:
+            self._restore(profile.user_id, old)
+            raise
+        self._notify(old, profile)
+        return profile
+
+    def delete(self, user_id):
+        old, future = self._delete(user_id)
+        if old is None:
+            return None
+        try:
+            self._wait(future)
+        except Exception:
+            self._restore(user_id, old)
+            raise
+        self._notify(old, None)
+        return old
+
+    async def delete_async(self, user_id):
+        old, future = self._delete(user_id)
+        if old is None:
+            return None
+        try:
+            await self._wait_async(future)
+        except Exception:
+            self._restore(user_id, old)
+            raise
+        self._notify(old, None)
+        return old
+
+    def compact(self):
+        # Fold the journal back into the JSON array file. Appends hold a
+        # shared lock on the journal (persistence.append_file); the exclusive
+        # lock keeps them out while the journal is re-read, folded in and
+        # emptied. A process that doesn't get it (another worker compacting,
+        # or an append in flight) leaves compaction to the next chance.
+        with self._lock:
+            if self._pending or not os.path.exists(self.journal_path):
+                return
+            with open(self.journal_path, "ab") as journal:
+                try:
+                    fcntl.flock(journal, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except BlockingIOError:
+                    return
+                self._load()  # never write back a stale view
+                if self._journal_ops:
+                    data = json.dumps([p.to_dict() for p in self._profiles.values()], indent=2)
+                    write_atomic(self.path, data.encode("utf-8"), writer.fsync)
+                    journal.truncate(0)
+                    self._journal_ops = 0
+                self._version = self._stat()
+
+
+PROFILE_PATHS = {
+    "maternal": MATERNAL_PROFILES_PATH,
+    "men": MEN_PROFILES_PATH,
+}
+
+# kind -> [listener(old_profile, new_profile)], called after every put/delete
+_listeners = {kind: [] for kind in PROFILE_PATHS}
+
+for _kind, _path in PROFILE_PATHS.items():
+    registry.register(
+        f"{_kind}_profiles",
+        lambda path=_path, kind=_kind: UserProfileStore(path, _listeners[kind])
+    )
+
+def get_profile_store(kind):
+    return registry.get(f"{kind}_profiles")
+
+def on_profile_change(kind, listener):
+    _listeners[kind].append(listener)
+
+def compact_profile_stores():
+    for kind in PROFILE_PATHS:
+        if registry.is_loaded(f"{kind}_profiles"):
+            get_profile_store(kind).compact()
+
+
+# ==== CRUD endpoints ====
+class MaternalProfile(BaseModel):
+    user_id: str
+    stage: str
+    age: int
+    height: float
+    weight: float
+    region: str
+    BMI: float
+    preconditions: Dict[str, bool] = {}
+
+class MenProfile(BaseModel):
+    user_id: str
+    region: str
+    age: int
+    weight_kg: float
+    height_cm: float
+    bmi: float
+    diet: Literal["healthy", "average", "unhealthy"]
+    diet_one_hot: Optional[Dict[str, int]] = None
+    exercise: bool
+    smoker: bool
+    sleep_hours: float
+
+
+# Store loads and reloads read the files, so the handlers reach the stores
+# through the threadpool and only await the journal writes on the loop
+def add_profile_routes(kind, model):
+    @router.get(f"/profiles/{kind}")
+    async def list_profiles(offset: int = Query(0, ge=0), limit: int = Query(100, ge=1, le=1000)):
+        def page():
+            store = get_profile_store(kind)
+            return {
+                "total": len(store),
+                "profiles": [p.to_dict() for p in store.page(offset, limit)],
+            }
+        return await run_in_threadpool(page)
+
+    @router.get(f"/profiles/{kind}/{{user_id}}")
+    async def get_profile(user_id: str):
+        profile = await run_in_threadpool(lambda: get_profile_store(kind).get(user_id))
+        if profile is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return profile.to_dict()
+
+    @router.post(f"/profiles/{kind}", status_code=201)
+    async def create_profile(profile: model):
+        if await run_in_threadpool(lambda: get_profile_store(kind).get(profile.user_id)) is not None:
+            raise HTTPException(status_code=409, detail="User already exists")
+        return (await get_profile_store(kind).put_async(profile.model_dump(exclude_none=True))).to_dict()
+
+    @router.put(f"/profiles/{kind}/{{user_id}}")
+    async def update_profile(user_id: str, profile: model):
+        if profile.user_id != user_id:
+            raise HTTPException(status_code=400, detail="user_id in body does not match path")
+        store = await run_in_threadpool(get_profile_store, kind)
+        return (await store.put_async(profile.model_dump(exclude_none=True))).to_dict()
+
+    @router.delete(f"/profiles/{kind}/{{user_id}}")
+    async def delete_profile(user_id: str):
+        store = await run_in_threadpool(get_profile_store, kind)
+        if await store.delete_async(user_id) is None:
+            raise HTTPException(status_code=404, detail="User not found")
+        return {"message": "Profile deleted"}
+
+add_profile_routes("maternal", MaternalProfile)
+add_profile_routes("men", MenProfile)
@@ -1,22 +1,72 @@
-from fastapi import APIRouter, HTTPException
-import json
+from fastapi import APIRouter, HTTPException, Query, Request
 import os
 
+from jsoncollection import JsonCollection, RenderedJson, cached_response
+from metrics import span
+from registry import registry
+from search import CollectionSearch
+
 router = APIRouter()
 
 RECIPES_PATH = os.path.join(os.path.dirname(__file__), "recipes.json")
 
-with open(RECIPES_PATH, "r", encoding="utf-8") as f:
-    recipes = json.load(f)
+# Loaded once, on first use; picked up again when the file changes
+registry.register("recipes", lambda: JsonCollection(RECIPES_PATH))
+registry.register("recipe_search", lambda: CollectionSearch(
+    registry.get("recipes"), {"name": 3.0, "category": 2.0, "ingredients": 1.0}
+))
 
-@router.get("/recipes")
-def list_recipes():
+def get_recipes():
+    return registry.get("recipes").refresh()
+
+# Responses are serialized once per version of recipes.json
+def _render_list(items, by_id):
     # Return only id and name (and maybe category)
-    return [{"id": r["id"], "name": r["name"], "category": r["category"]} for r in recipes]
+    return RenderedJson([{"id": r["id"], "name": r["name"], "category": r["category"]} for r in items])
+
+def _render_details(items, by_id):
+    return {recipe_id: RenderedJson(recipe) for recipe_id, recipe in by_id.items()}
+
+@router.get("/recipes")
+def list_recipes(request: Request):
+    return cached_response(request, get_recipes().derived("list", _render_list))
+
+@router.get("/recipes/search")
+def search_recipes(
+    q: str = Query(..., min_length=1),
+    offset: int = Query(0, ge=0),
+    limit: int = Query(20, ge=1, le=100),
+):
+    with span("search", collection="recipes"):
+        total, hits = registry.get("recipe_search").search(q, offset, limit)
+    return {
+        "query": q,
+        "total": total,
+        "offset": offset,
+        "limit": limit,
+        "results": [
+            {
+                "id": r["id"],
+                "name": r["name"],
+                "category": r["category"],
+                "calories": r["calories"],
+                "protein": r["protein"],
+                "fat": r["fat"],
+                "carbs": r["carbs"],
+                "iron": r["iron"],
+                "calcium": r["calcium"],
+                "vitaminA": r["vitaminA"],
+                "vitaminC": r["vitaminC"],
+                "folate": r["folate"],
+                "score": round(score, 4)
+            }
+            for r, score in hits
+        ]
+    }
 
 @router.get("/recipes/{recipe_id}")
-def get_recipe(recipe_id: int):
-    for recipe in recipes:
-        if recipe["id"] == recipe_id:
-            return recipe
-    raise HTTPException(status_code=404, detail="Recipe not found")
+def get_recipe(recipe_id: int, request: Request):
+    rendered = get_recipes().derived("details", _render_details).get(recipe_id)
+    if rendered is None:
+        raise HTTPException(status_code=404, detail="Recipe not found")
+    return cached_response(request, rendered)
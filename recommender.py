@@ -1,15 +1,87 @@
+import os
+import threading
+
 import pandas as pd
 import numpy as np
-from sklearn.preprocessing import MinMaxScaler
-from sklearn.metrics.pairwise import cosine_similarity
+
+from foodcatalog import BASE_DIR, FOOD_PATH, get_food_catalog
+from regions import ALL
+
+# Bumped when the rows a region's scaling is fitted on change, so artifacts
+# fitted under the old rule refit (2: canonical regions, 'all' rows included)
+SCALING_VERSION = 2
 
 class NutrientGapRecommender:
     def __init__(self, dataset_path):
-        self.df = pd.read_csv(dataset_path)
+        self.dataset_path = dataset_path
         self.features = ['calories', 'protein', 'fat', 'carbs', 'iron',
                          'calcium', 'vitaminA', 'vitaminC', 'folate']
-        self.scaler = MinMaxScaler()
         self.thresholds = self.set_thresholds()
+        self.region_scaling = {}
+        self.scaling_digest = None
+        self.scaling_version = SCALING_VERSION
+        self._init_runtime()
+
+    def _init_runtime(self):
+        # Per-process cache of scaled, L2-normalized region matrices
+        self._scaled = {}
+        self._lock = threading.Lock()
+
+    # The food data comes from the shared catalog instead of being pickled
+    # into the artifact, so edits to the CSV are picked up without retraining.
+    @property
+    def catalog(self):
+        return get_food_catalog(self.dataset_path)
+
+    @property
+    def df(self):
+        return self.catalog.df
+
+    def __getstate__(self):
+        state = {k: v for k, v in self.__dict__.items() if k not in ("df", "_scaled", "_lock")}
+        # Keep the artifact relocatable when the CSV sits next to the code
+        path = os.path.abspath(state["dataset_path"])
+        if os.path.dirname(path) == BASE_DIR:
+            state["dataset_path"] = os.path.basename(path)
+        return state
+
+    def __setstate__(self, state):
+        # Artifacts saved before the catalog existed carry a DataFrame copy
+        # and a MinMaxScaler that was refitted per request
+        if "df" in state:
+            state = {k: v for k, v in state.items() if k not in ("df", "scaler")}
+            state.setdefault("dataset_path", FOOD_PATH)
+        state.setdefault("region_scaling", {})
+        state.setdefault("scaling_digest", None)
+        state.setdefault("scaling_version", 1)
+        if not os.path.isabs(state["dataset_path"]):
+            state["dataset_path"] = os.path.join(BASE_DIR, state["dataset_path"])
+        self.__dict__.update(state)
+        self._init_runtime()
+
+    def fit_region_scaling(self):
+        # Min-max parameters per canonical region (same rows as
+        # filter_by_region), fitted once at build time instead of per request
+        catalog = self.catalog
+        partition = catalog.region_partition
+        data = catalog.matrix[:, catalog.columns(self.features)]
+
+        region_scaling = {}
+        for region in partition.regions + (ALL,):
+            rows = partition.rows(region)
+            if len(rows) == 0:
+                continue
+            data_min = data[rows].min(axis=0)
+            data_range = data[rows].max(axis=0) - data_min
+            data_range[data_range == 0] = 1.0  # same as MinMaxScaler
+            region_scaling[region] = (data_min, 1.0 / data_range)
+
+        with self._lock:
+            self.region_scaling = region_scaling
+            self.scaling_digest = catalog.digest
+            self.scaling_version = SCALING_VERSION
+            self._scaled = {}
+        return self
 
     def set_thresholds(self):
         return {
@@ -25,12 +97,13 @@ class NutrientGapRecommender:
         }
 
     def filter_by_region(self, user_region):
-        return self.df[(self.df['region'] == user_region) | (self.df['region'] == 'All')].copy()
+        return self.df.iloc[self.catalog.region_rows(user_region)].copy()
 
     def calculate_intake(self, food_names):
-        selected = self.df[self.df['food_name'].isin(food_names)]
-        intake = selected[self.features].sum().to_dict()
-        return intake
+        catalog = self.catalog
+        rows = sorted({catalog.row_for_name(name) for name in food_names} - {-1})
+        totals = catalog.matrix[rows][:, catalog.columns(self.features)].sum(axis=0)
+        return {f: float(v) for f, v in zip(self.features, totals)}
 
     def calculate_nutrient_gap(self, intake):
         gap = {}
@@ -40,20 +113,48 @@ class NutrientGapRecommender:
             gap[key] = max(required - consumed, 0)
         return gap
 
+    def scaled_region(self, user_region):
+        # (rows, unit-length scaled matrix, min, scale) for one region; the
+        # scaling is refitted only if the catalog (or SCALING_VERSION)
+        # changed since training
+        catalog = self.catalog
+        if self.scaling_digest != catalog.digest or self.scaling_version != SCALING_VERSION:
+            self.fit_region_scaling()
+
+        region = catalog.region_partition.key(user_region)
+        cached = self._scaled.get(region)
+        if cached is not None:
+            return cached
+        params = self.region_scaling.get(region)
+        if params is None:
+            return None
+
+        data_min, scale = params
+        rows = catalog.region_rows(region)
+        scaled = (catalog.matrix[rows][:, catalog.columns(self.features)] - data_min) * scale
+        norms = np.linalg.norm(scaled, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        scaled = scaled / norms
+        scaled.setflags(write=False)
+        with self._lock:
+            return self._scaled.setdefault(region, (rows, scaled, data_min, scale))
+
     def recommend_by_gap(self, user_region, food_names, top_n=5):
         intake = self.calculate_intake(food_names)
         gap = self.calculate_nutrient_gap(intake)
 
-        filtered_df = self.filter_by_region(user_region)
-        if filtered_df.empty:
+        region = self.scaled_region(user_region)
+        if region is None:
             return pd.DataFrame(columns=['food_name', 'region', 'similarity'])
+        rows, scaled_data, data_min, scale = region
 
-        nutrition_data = filtered_df[self.features]
-        scaled_data = self.scaler.fit_transform(nutrition_data)
+        gap_vector = (np.array([gap.get(f, 0.0) for f in self.features]) - data_min) * scale
+        gap_norm = np.linalg.norm(gap_vector)
+        similarities = scaled_data @ (gap_vector / (gap_norm if gap_norm else 1.0))
 
-        gap_vector = self.scaler.transform([[gap.get(f, 0.0) for f in self.features]])
-        similarities = cosine_similarity(gap_vector, scaled_data).flatten()
-        filtered_df['similarity'] = similarities
+        n = min(top_n, len(rows))
+        top = np.argpartition(-similarities, n - 1)[:n] if n > 0 else np.empty(0, dtype=np.intp)
+        top = top[np.argsort(-similarities[top], kind="stable")]
 
-        top_foods = filtered_df.sort_values(by='similarity', ascending=False)
-        return top_foods[['food_name', 'region', 'iron', 'folate', 'protein', 'calcium', 'similarity']].head(top_n)
+        top_foods = self.df.iloc[rows[top]][['food_name', 'region', 'iron', 'folate', 'protein', 'calcium']]
+        return top_foods.assign(similarity=similarities[top])
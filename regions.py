@@ -0,0 +1,58 @@
+import numpy as np
+
+# Rows tagged with this region are candidates for every user
+ALL = "all"
+
+# Canonical region names are the lowercase values used in nepalifood.csv;
+# other spellings users and profiles send are mapped onto them
+REGION_ALIASES = {
+    "mountain": "himalayan",
+    "mountains": "himalayan",
+    "mountainous": "himalayan",
+    "himalaya": "himalayan",
+    "himal": "himalayan",
+    "hill": "hilly",
+    "hills": "hilly",
+    "pahad": "hilly",
+    "plain": "terai",
+    "plains": "terai",
+    "madhesh": "terai",
+}
+
+
+def canonical_region(region):
+    region = str(region).strip().lower()
+    return REGION_ALIASES.get(region, region)
+
+
+# Row indexes per canonical region for one fixed list of rows, computed once.
+# rows(region) is the region's own rows plus the 'all' rows, in row order;
+# a region no row has (e.g. 'urban') gets just the 'all' rows.
+class RegionPartition:
+    def __init__(self, regions):
+        self.labels = np.array([canonical_region(r) for r in regions], dtype=object)
+        own = {r: np.flatnonzero(self.labels == r) for r in set(self.labels.tolist())}
+        all_rows = own.pop(ALL, np.empty(0, dtype=np.intp))
+
+        self.regions = tuple(sorted(own))
+        self._rows = {r: np.union1d(rows, all_rows) for r, rows in own.items()}
+        self._rows[ALL] = all_rows
+        for rows in self._rows.values():
+            rows.setflags(write=False)
+
+    def key(self, region):
+        # Canonical name of region, or ALL for regions without rows of their own
+        region = canonical_region(region)
+        return region if region in self._rows else ALL
+
+    def rows(self, region):
+        return self._rows[self.key(region)]
+
+    def split(self, matrix):
+        # key -> (rows, read-only matrix[rows]) for every region and ALL
+        parts = {}
+        for key, rows in self._rows.items():
+            sub_matrix = matrix[rows]
+            sub_matrix.setflags(write=False)
+            parts[key] = (rows, sub_matrix)
+        return parts
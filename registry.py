@@ -0,0 +1,76 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Named, lazily loaded process-wide resources (models, JSON catalogs, stores).
+# Each loader runs at most once, on first get() or during warm_up(), and the
+# time it took is kept for the startup report.
+class ModelRegistry:
+    def __init__(self):
+        self._loaders = {}
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+        self._warmers = {}
+        self.timings = {}
+
+    def register(self, name, loader):
+        with self._lock:
+            self._loaders[name] = loader
+            self._locks.setdefault(name, threading.Lock())
+
+    def add_warmer(self, name, fn):
+        # Resources with their own cache/reload logic (e.g. the food catalog)
+        # are primed during warm_up() but not pinned in the registry
+        self._warmers[name] = fn
+
+    def get(self, name):
+        try:
+            return self._values[name]
+        except KeyError:
+            pass
+        with self._locks[name]:
+            if name not in self._values:
+                with self.timing("load", name):
+                    self._values[name] = self._loaders[name]()
+            return self._values[name]
+
+    def is_loaded(self, name):
+        return name in self._values
+
+    def reset(self, name):
+        # Drop a cached value so the next get() reloads it
+        with self._locks[name]:
+            self._values.pop(name, None)
+
+    def warm_up(self, names=None):
+        for name in names or list(self._loaders):
+            self.get(name)
+        if names is None:
+            for fn in self._warmers.values():
+                fn()
+
+    @contextmanager
+    def timing(self, kind, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.timings[f"{kind}:{name}"] = {
+                "kind": kind,
+                "name": name,
+                "seconds": round(time.perf_counter() - start, 6),
+            }
+
+    def report(self):
+        entries = sorted(self.timings.values(), key=lambda e: -e["seconds"])
+        return {
+            "total_import_seconds": round(sum(e["seconds"] for e in entries if e["kind"] == "import"), 6),
+            "total_load_seconds": round(sum(e["seconds"] for e in entries if e["kind"] == "load"), 6),
+            "components": entries,
+            "pending": sorted(set(self._loaders) - set(self._values)),
+        }
+
+
+registry = ModelRegistry()
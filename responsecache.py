@@ -0,0 +1,87 @@
+import hashlib
+import json
+import logging
+import os
+
+from fastapi import Response
+
+from jsoncollection import json_bytes
+from lrucache import LRUCache
+
+logger = logging.getLogger(__name__)
+
+RESPONSE_CACHE_SIZE = int(os.environ.get("MAMACARE_RESPONSE_CACHE_SIZE", "4096"))
+# Optional shared backend, e.g. redis://localhost:6379/0 (needs the redis package)
+REDIS_URL = os.environ.get("MAMACARE_REDIS_URL")
+# Entries of old data versions are never read again; let Redis expire them
+REDIS_TTL = int(os.environ.get("MAMACARE_REDIS_TTL", "3600"))
+
+
+def data_version(*digests):
+    # Short hash over the content digests a response was computed from, so
+    # editing nepalifood.csv / threshold.json moves every key to a new version
+    return hashlib.sha1(":".join(str(d) for d in digests).encode("utf-8")).hexdigest()[:16]
+
+
+def _connect(url):
+    try:
+        import redis
+    except ImportError:
+        logger.warning("MAMACARE_REDIS_URL is set but redis is not installed; using the in-process cache only")
+        return None
+    return redis.Redis.from_url(url, socket_timeout=0.05, socket_connect_timeout=0.05)
+
+
+# Serialized JSON responses keyed by (data version, input signature). The
+# in-process LRU is always consulted first; with MAMACARE_REDIS_URL set a
+# Redis-compatible server is shared between workers behind it. Backend
+# errors only cost a cache miss.
+class ResponseCache:
+    def __init__(self, name, maxsize=RESPONSE_CACHE_SIZE, redis_url=REDIS_URL):
+        self.name = name
+        self.local = LRUCache(maxsize)
+        self.remote = _connect(redis_url) if redis_url else None
+        self.remote_hits = 0
+        self.remote_errors = 0
+
+    def key(self, version, *parts):
+        return f"mamacare:{self.name}:{version}:" + json.dumps(parts, separators=(",", ":"))
+
+    def get(self, key):
+        body = self.local.get(key)
+        if body is not None or self.remote is None:
+            return body
+        try:
+            body = self.remote.get(key)
+        except Exception as e:
+            self.remote_errors += 1
+            logger.debug("Response cache %s: redis get failed: %s", self.name, e)
+            return None
+        if body is not None:
+            self.remote_hits += 1
+            self.local.set(key, body)
+        return body
+
+    def set(self, key, content):
+        body = json_bytes(content)
+        self.local.set(key, body)
+        if self.remote is not None:
+            try:
+                self.remote.set(key, body, ex=REDIS_TTL)
+            except Exception as e:
+                self.remote_errors += 1
+                logger.debug("Response cache %s: redis set failed: %s", self.name, e)
+        return body
+
+    def stats(self):
+        stats = self.local.stats()
+        # A local miss answered by Redis counts as a hit
+        stats["hits"] += self.remote_hits
+        stats["misses"] -= self.remote_hits
+        stats["remote"] = self.remote is not None
+        stats["remote_errors"] = self.remote_errors
+        return stats
+
+
+def json_response(body):
+    return Response(body, media_type="application/json")
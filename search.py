@@ -0,0 +1,187 @@
+import bisect
+import hashlib
+import heapq
+import math
+import re
+import threading
+
+TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+PREFIX_WEIGHT = 0.7      # "mom" -> "momo"
+FUZZY_WEIGHT = 0.5       # trigram neighbours for misspellings
+FUZZY_MIN_SIMILARITY = 0.4
+MAX_EXPANSIONS = 20
+
+
+def tokenize(text):
+    return TOKEN_RE.findall(text.lower())
+
+
+def trigrams(token):
+    padded = f"  {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def field_text(value):
+    if value is None:
+        return ""
+    if isinstance(value, (list, tuple)):
+        return " ".join(field_text(v) for v in value)
+    return str(value)
+
+
+# In-memory inverted index over a set of documents with weighted fields.
+# Postings map token -> {doc_id: weight}; a sorted vocabulary serves prefix
+# matches and a trigram -> tokens map serves fuzzy matches. update() only
+# re-indexes documents whose indexed text changed.
+class SearchIndex:
+    def __init__(self, fields):
+        self.fields = fields  # field name -> weight
+        self._postings = {}
+        self._doc_terms = {}
+        self._doc_hashes = {}
+        self._trigrams = {}
+        self._vocabulary = []
+        self._vocabulary_dirty = False
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._doc_terms)
+
+    def _document_terms(self, doc):
+        terms = {}
+        for field, weight in self.fields.items():
+            for token in tokenize(field_text(doc.get(field))):
+                terms[token] = terms.get(token, 0.0) + weight
+        return terms
+
+    def _document_hash(self, doc):
+        text = "\x00".join(field_text(doc.get(field)) for field in self.fields)
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _add(self, doc_id, doc):
+        terms = self._document_terms(doc)
+        for token, weight in terms.items():
+            postings = self._postings.get(token)
+            if postings is None:
+                postings = self._postings[token] = {}
+                for gram in trigrams(token):
+                    self._trigrams.setdefault(gram, set()).add(token)
+                self._vocabulary_dirty = True
+            postings[doc_id] = weight
+        self._doc_terms[doc_id] = terms
+
+    def _remove(self, doc_id):
+        for token in self._doc_terms.pop(doc_id, {}):
+            postings = self._postings[token]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[token]
+                for gram in trigrams(token):
+                    tokens = self._trigrams[gram]
+                    tokens.discard(token)
+                    if not tokens:
+                        del self._trigrams[gram]
+                self._vocabulary_dirty = True
+        self._doc_hashes.pop(doc_id, None)
+
+    def update(self, docs):
+        # docs: {doc_id: record}. Returns how many documents were (re)indexed
+        # or dropped.
+        changed = 0
+        with self._lock:
+            for doc_id in set(self._doc_terms) - set(docs):
+                self._remove(doc_id)
+                changed += 1
+            for doc_id, doc in docs.items():
+                digest = self._document_hash(doc)
+                if self._doc_hashes.get(doc_id) == digest:
+                    continue
+                self._remove(doc_id)
+                self._add(doc_id, doc)
+                self._doc_hashes[doc_id] = digest
+                changed += 1
+            if self._vocabulary_dirty:
+                self._vocabulary = sorted(self._postings)
+                self._vocabulary_dirty = False
+        return changed
+
+    def _expansions(self, term):
+        # [(token, weight)] candidates for one query term
+        if term in self._postings:
+            matches = [(term, 1.0)]
+        else:
+            matches = []
+
+        start = bisect.bisect_left(self._vocabulary, term)
+        for token in self._vocabulary[start:start + MAX_EXPANSIONS + 1]:
+            if not token.startswith(term):
+                break
+            if token != term:
+                matches.append((token, PREFIX_WEIGHT))
+
+        if not matches and len(term) >= 3:
+            grams = trigrams(term)
+            overlap = {}
+            for gram in grams:
+                for token in self._trigrams.get(gram, ()):
+                    overlap[token] = overlap.get(token, 0) + 1
+            for token, shared in sorted(overlap.items(), key=lambda item: -item[1])[:MAX_EXPANSIONS]:
+                similarity = shared / len(grams | trigrams(token))
+                if similarity >= FUZZY_MIN_SIMILARITY:
+                    matches.append((token, FUZZY_WEIGHT * similarity))
+        return matches
+
+    def search(self, query, offset=0, limit=10):
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return 0, []
+
+        with self._lock:
+            n_docs = len(self._doc_terms)
+            scores = {}
+            matched = {}
+            for term in terms:
+                best = {}
+                for token, weight in self._expansions(term):
+                    postings = self._postings[token]
+                    idf = math.log(1 + n_docs / len(postings))
+                    for doc_id, tf in postings.items():
+                        score = weight * idf * tf
+                        if score > best.get(doc_id, 0.0):
+                            best[doc_id] = score
+                for doc_id, score in best.items():
+                    scores[doc_id] = scores.get(doc_id, 0.0) + score
+                    matched[doc_id] = matched.get(doc_id, 0) + 1
+
+        # Documents matching more of the query terms rank first; only the
+        # requested page is ordered, not every match
+        ranked = heapq.nsmallest(
+            offset + limit,
+            ((score * matched[doc_id] / len(terms), doc_id) for doc_id, score in scores.items()),
+            key=lambda item: (-item[0], item[1])
+        )
+        return len(scores), ranked[offset:]
+
+
+# Keeps a SearchIndex in sync with a JsonCollection: every query first lets
+# the collection pick up file changes, then re-indexes only what changed.
+class CollectionSearch:
+    def __init__(self, collection, fields):
+        self.collection = collection
+        self.index = SearchIndex(fields)
+        self._version = None
+        self._by_id = {}
+        self._lock = threading.Lock()
+
+    def search(self, query, offset=0, limit=10):
+        _, by_id, version = self.collection.refresh().snapshot()
+        # Hits are mapped through the documents the index was built from:
+        # another thread may have indexed a newer version than our snapshot
+        with self._lock:
+            if version != self._version:
+                self.index.update(by_id)
+                self._version, self._by_id = version, by_id
+            by_id = self._by_id
+            total, ranked = self.index.search(query, offset, limit)
+        return total, [(by_id[doc_id], score) for score, doc_id in ranked]
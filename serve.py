@@ -0,0 +1,42 @@
+# Multi-worker launcher:
+#
+#   python serve.py --workers 4 [--host 0.0.0.0] [--port 8000]
+#
+# Before uvicorn spawns its workers, the parent compiles the read-only data
+# (food catalog, sperm health forest) into memory-mapped snapshots on tmpfs
+# (/dev/shm, or MAMACARE_SNAPSHOT_DIR if set). Each worker maps those files
+# instead of parsing / unpickling a private copy, so the pages exist once
+# however many workers run.
+#
+# Writable state stays in the shared files: every worker appends to the
+# same meal log and profile journals and reads the other workers' writes
+# back from them (the meal store before each read, the profile stores
+# within a second), so any worker can answer for any user.
+import argparse
+import os
+
+SHARED_DIR = "/dev/shm/mamacare"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the API with N workers sharing read-only data")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    # Must be set before snapshot is imported; the workers inherit it
+    if "MAMACARE_SNAPSHOT_DIR" not in os.environ and os.path.isdir("/dev/shm"):
+        os.environ["MAMACARE_SNAPSHOT_DIR"] = SHARED_DIR
+
+    from snapshot import compile_shared
+
+    for name, (path, rows) in compile_shared().items():
+        print(f"{name}: {rows} rows -> {path}")
+
+    import uvicorn
+    uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers)
+
+
+if __name__ == "__main__":
+    main()
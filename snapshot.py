@@ -0,0 +1,131 @@
+import json
+import os
+import shutil
+
+import numpy as np
+
+from metrics import span
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_DIR = os.environ.get("MAMACARE_SNAPSHOT_DIR", os.path.join(BASE_DIR, "snapshots"))
+
+FORMAT = 1
+
+
+# Columnar binary snapshots: one directory per dataset holding
+#   manifest.json      format, caller metadata, column kinds
+#   <name>.npy         fixed-dtype arrays, memory-mapped read-only on load
+#   <name>.codes.npy   int32 dictionary codes of a string / JSON column (-1 = missing)
+#   <name>.dict.json   that column's dictionary
+# A directory is written next to the old one and swapped in with renames, so
+# a reader sees either snapshot complete. Pages of the mapped arrays are
+# shared by every process that maps the same file.
+
+
+def dictionary_encode(values, missing=None):
+    # -> (int32 codes, dictionary); values equal to `missing` get code -1
+    codes = np.empty(len(values), dtype=np.int32)
+    index = {}
+    for i, value in enumerate(values):
+        codes[i] = -1 if value is missing else index.setdefault(value, len(index))
+    return codes, list(index)
+
+
+def write_snapshot(path, meta, arrays=None, strings=None, values=None):
+    # arrays:  name -> ndarray
+    # strings: name -> list of str (None for missing)
+    # values:  name -> list of JSON-serializable values (None for missing);
+    #          stored as their JSON text, so ints, floats and nested values
+    #          come back exactly as they went in
+    arrays, strings, values = arrays or {}, strings or {}, values or {}
+    tmp_path = path + ".tmp"
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    os.makedirs(tmp_path)
+
+    columns = {}
+    for name, array in arrays.items():
+        np.save(os.path.join(tmp_path, f"{name}.npy"), np.ascontiguousarray(array))
+        columns[name] = "array"
+    for kind, column_values in (("str", strings), ("json", values)):
+        for name, items in column_values.items():
+            if kind == "json":
+                items = [None if v is None else json.dumps(v) for v in items]
+            codes, dictionary = dictionary_encode(items)
+            np.save(os.path.join(tmp_path, f"{name}.codes.npy"), codes)
+            with open(os.path.join(tmp_path, f"{name}.dict.json"), "w", encoding="utf-8") as f:
+                json.dump(dictionary, f)
+            columns[name] = kind
+
+    with open(os.path.join(tmp_path, "manifest.json"), "w", encoding="utf-8") as f:
+        json.dump({"format": FORMAT, "meta": meta, "columns": columns}, f)
+
+    # Already-mapped files of the old snapshot stay valid after it is removed
+    old_path = path + ".old"
+    shutil.rmtree(old_path, ignore_errors=True)
+    if os.path.exists(path):
+        os.replace(path, old_path)
+    os.replace(tmp_path, path)
+    shutil.rmtree(old_path, ignore_errors=True)
+
+
+class Snapshot:
+    def __init__(self, path, manifest):
+        self.path = path
+        self.meta = manifest["meta"]
+        self.columns = manifest["columns"]
+
+    @classmethod
+    def open(cls, path):
+        # None if there is no (complete, current-format) snapshot at path
+        try:
+            with open(os.path.join(path, "manifest.json"), "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if manifest.get("format") != FORMAT:
+            return None
+        return cls(path, manifest)
+
+    def array(self, name):
+        # Plain read-only ndarray view of the mapping
+        with span("file_io", target="snapshot"):
+            return np.asarray(np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r"))
+
+    def codes(self, name):
+        return self.array(f"{name}.codes")
+
+    def dictionary(self, name):
+        with span("file_io", target="snapshot"), \
+                open(os.path.join(self.path, f"{name}.dict.json"), "r", encoding="utf-8") as f:
+            dictionary = json.load(f)
+        if self.columns[name] == "json":
+            dictionary = [json.loads(v) for v in dictionary]
+        return dictionary
+
+    def decode(self, name, missing=None):
+        # Column as an object array; code -1 decodes to `missing`
+        values = self.dictionary(name)
+        dictionary = np.empty(len(values) + 1, dtype=object)
+        for i, value in enumerate(values):  # element-wise: values may be lists
+            dictionary[i] = value
+        dictionary[-1] = missing
+        return dictionary[self.codes(name)]
+
+
+def compile_shared():
+    # Read-only datasets every worker process can map instead of loading
+    from foodcatalog import compile_catalog_snapshot
+    from sperm import compile_model_snapshot
+
+    return {"food catalog": compile_catalog_snapshot(), "sperm model": compile_model_snapshot()}
+
+
+if __name__ == "__main__":
+    # Compile every dataset with a snapshot format:
+    #   python snapshot.py
+    from mealstore import compile_meal_snapshot
+
+    compiled = compile_shared()
+    compiled["meal log"] = compile_meal_snapshot()
+    for name, (path, rows) in compiled.items():
+        print(f"{name}: {rows} rows -> {path}")
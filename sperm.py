@@ -1,31 +1,65 @@
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from typing import List
-import pandas as pd
 import numpy as np
-import joblib
+import hashlib
 import json
 import os
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+from types import SimpleNamespace
+
+from cosine import top_n_indices
+from foodcatalog import get_food_catalog
+from forest import ForestPredictor, export_compiled_forest
+from lrucache import LRUCache
+from metrics import metrics, span
+from persistence import write_atomic
+from profiles import get_profile_store, on_profile_change
+from registry import registry
+from snapshot import SNAPSHOT_DIR, Snapshot
 
 router = APIRouter()
 
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# Load data once
-FOOD_PATH = os.path.join(os.path.dirname(__file__), "nepalifood.csv")
-USERS_PATH = os.path.join(os.path.dirname(__file__), "user_profiles_no_score.json")
+# Loaded once, on first use
 # MODEL_PATH = os.path.join(os.path.dirname(__file__), "../models/sperm_health_model.joblib")
 # SCALER_PATH = os.path.join(os.path.dirname(__file__), "../models/sperm_health_scaler.joblib")
 
 MODEL_PATH = os.path.join(BASE_DIR, "model", "sperm_health_model.joblib")
 SCALER_PATH = os.path.join(BASE_DIR, "model", "sperm_health_scaler.joblib")
+SCORES_PATH = os.path.join(BASE_DIR, "model", "sperm_scores.json")
+MODEL_SNAPSHOT_PATH = os.path.join(SNAPSHOT_DIR, "sperm_health_model")
+
+def joblib_loader(path):
+    def load():
+        import joblib
+        return joblib.load(path)
+    return load
+
+# With a snapshot of the current model + scaler (compile_model_snapshot),
+# workers map the compiled forest and the scaler parameters, shared between
+# processes, and never import sklearn. Otherwise the pickles are loaded.
+def load_sperm_model():
+    forest = ForestPredictor.open(MODEL_SNAPSHOT_PATH, model_fingerprint())
+    return forest if forest is not None else joblib_loader(MODEL_PATH)()
+
+def load_sperm_scaler():
+    snapshot = Snapshot.open(MODEL_SNAPSHOT_PATH)
+    if snapshot is not None and snapshot.meta.get("sha1") == model_fingerprint():
+        return SimpleNamespace(mean_=snapshot.array("scaler_mean"), scale_=snapshot.array("scaler_scale"))
+    return joblib_loader(SCALER_PATH)()
+
+def compile_model_snapshot(snapshot_path=MODEL_SNAPSHOT_PATH):
+    scaler = joblib_loader(SCALER_PATH)()
+    trees = export_compiled_forest(
+        snapshot_path, joblib_loader(MODEL_PATH)(), model_fingerprint(),
+        extra_arrays={"scaler_mean": scaler.mean_, "scaler_scale": scaler.scale_}
+    )
+    return snapshot_path, trees
 
-food_df = pd.read_csv(FOOD_PATH)
-with open(USERS_PATH) as f:
-    user_profiles = json.load(f)
-model = joblib.load(MODEL_PATH)
-scaler = joblib.load(SCALER_PATH)
+registry.register("sperm_model", load_sperm_model)
+registry.register("sperm_scaler", load_sperm_scaler)
 
 nutrients = ['vitaminC', 'vitaminA', 'folate', 'iron', 'calcium', 'protein', 'fat']
 nutrient_targets = {
@@ -38,6 +72,171 @@ nutrient_targets = {
     'fat': 60
 }
 
+diet_encoding = {"unhealthy": 0, "average": 1, "healthy": 2}
+
+def profile_features(user):
+    # The only profile fields the sperm health model looks at
+    return (user["age"],
+            int(user["smoker"]),
+            diet_encoding[user["diet"]],
+            int(user["exercise"]),
+            user["sleep_hours"],
+            user["bmi"])
+
+
+# Immutable scoring state for one catalog version: lowercase name index,
+# pre-normalized nutrient vectors (whole catalog and per region) and the
+# scaler parameters as plain arrays.
+# Nothing here is written after construction, so requests can share it freely.
+class SpermHealthEngine:
+    def __init__(self, catalog, model, scaler, top_n=5):
+        self.catalog = catalog
+        self.model = model
+        self.top_n = top_n
+
+        # StandardScaler.transform without sklearn's per-call validation
+        self.scaler_mean = np.asarray(scaler.mean_, dtype=np.float64)
+        self.scaler_scale = np.asarray(scaler.scale_, dtype=np.float64)
+
+        self.targets = np.array([nutrient_targets[nut] for nut in nutrients], dtype=np.float64)
+
+        self.food_vectors = catalog.matrix[:, catalog.columns(nutrients)]
+        norms = np.linalg.norm(self.food_vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1e-10
+        self.food_vectors_norm = self.food_vectors / norms
+        self.food_vectors_norm.setflags(write=False)
+        self.region_vectors = catalog.region_partition.split(self.food_vectors_norm)
+        self.region_vectors[None] = (np.arange(len(catalog)), self.food_vectors_norm)
+
+    def predict_scores(self, users):
+        # One scaled input matrix and one model.predict for all users
+        if not users:
+            return []
+        X = np.array([profile_features(u) for u in users], dtype=np.float64)
+        X_scaled = (X - self.scaler_mean) / self.scaler_scale
+        return [round(float(score), 2) for score in self.model.predict(X_scaled)]
+
+    def intake(self, meals):
+        # Hash lookups on lowercase names, then one weighted row sum
+        rows = np.array([self.catalog.row_for_name(m.food_name) for m in meals], dtype=np.intp)
+        grams = np.array([m.amount_grams for m in meals], dtype=np.float64)
+        known = rows >= 0
+        if not known.any():
+            return np.zeros(len(nutrients))
+        return (self.food_vectors[rows[known]] * (grams[known, None] / 100)).sum(axis=0)
+
+    def gaps(self, intake, sperm_score):
+        multiplier = 1.0 if sperm_score >= 80 else 1.2
+        return np.maximum(0, self.targets * multiplier - intake)
+
+    def recommend(self, gaps, region=None):
+        # Foods of the user's region plus the 'all' ones; the whole catalog
+        # when the region is unknown (None)
+        catalog = self.catalog
+        key = None if region is None else catalog.region_partition.key(region)
+        rows, vectors = self.region_vectors[key]
+        user_norm = np.linalg.norm(gaps)
+        if user_norm == 0:
+            rows = np.random.default_rng().choice(rows, size=min(self.top_n, len(rows)), replace=False)
+            return [
+                {"food_name": catalog.food_names[row], "region": catalog.regions[row]}
+                for row in rows
+            ]
+        similarities = vectors @ (gaps / user_norm)
+        top = top_n_indices(similarities, self.top_n)
+        return [
+            {"food_name": catalog.food_names[row], "similarity": float(similarities[i])}
+            for row, i in zip(rows[top], top)
+        ]
+
+    def report(self, meals, sperm_score, region=None):
+        intake = self.intake(meals)
+        gaps = self.gaps(intake, sperm_score)
+        return {
+            "sperm_health_score": sperm_score,
+            "nutrient_intake": dict(zip(nutrients, intake.tolist())),
+            "nutrient_gaps": dict(zip(nutrients, gaps.tolist())),
+            "recommendations": self.recommend(gaps, region)
+        }
+
+
+_engine = None
+_engine_lock = threading.Lock()
+
+def get_sperm_engine():
+    # Rebuilt only when the shared catalog is reloaded
+    global _engine
+    catalog = get_food_catalog()
+    engine = _engine
+    if engine is not None and engine.catalog is catalog:
+        return engine
+    with _engine_lock:
+        if _engine is None or _engine.catalog is not catalog:
+            _engine = SpermHealthEngine(catalog, registry.get("sperm_model"), registry.get("sperm_scaler"))
+        return _engine
+
+
+# Scores keyed by the profile feature tuple: an edited profile maps to a new
+# key, and identical profiles share one entry
+score_cache = LRUCache(
+    maxsize=int(os.environ.get("MAMACARE_SCORE_CACHE_SIZE", "10000")),
+    ttl=float(os.environ.get("MAMACARE_SCORE_CACHE_TTL", "86400")),
+)
+
+metrics.add_cache("sperm_scores", score_cache)
+
+def cached_scores(engine, users):
+    keys = [profile_features(u) for u in users]
+    scores = [score_cache.get(key) for key in keys]
+    missing = [i for i, score in enumerate(scores) if score is None]
+    if missing:
+        with span("model_predict", model="sperm"):
+            fresh = engine.predict_scores([users[i] for i in missing])
+        for i, score in zip(missing, fresh):
+            scores[i] = score
+            score_cache.set(keys[i], score)
+    return scores
+
+def invalidate_score(user):
+    score_cache.pop(profile_features(user))
+
+# Edited or deleted profiles drop their old score
+on_profile_change("men", lambda old, new: old is not None and invalidate_score(old))
+
+def model_fingerprint():
+    digest = hashlib.sha1()
+    for path in (MODEL_PATH, SCALER_PATH):
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+def load_scores(path=SCORES_PATH):
+    # Persisted scores are only trusted for the exact model/scaler they came from
+    if not os.path.exists(path):
+        return 0
+    with open(path, "r", encoding="utf-8") as f:
+        saved = json.load(f)
+    if saved.get("fingerprint") != model_fingerprint():
+        return 0
+    for *features, score in saved["scores"]:
+        score_cache.set(tuple(features), score)
+    return len(saved["scores"])
+
+def save_scores(path=SCORES_PATH):
+    scores = [[*features, score] for features, score in score_cache.items()]
+    data = json.dumps({"fingerprint": model_fingerprint(), "scores": scores})
+    write_atomic(path, data.encode("utf-8"), fsync=False)
+
+def precompute_scores():
+    # Startup warm-up: reuse persisted scores, batch-predict the rest of the
+    # profiles and write the combined set back for the next start
+    load_scores()
+    cached_scores(get_sperm_engine(), get_profile_store("men").all())
+    save_scores()
+
+registry.add_warmer("sperm_scores", precompute_scores)
+
+
 class MealLog(BaseModel):
     food_name: str
     amount_grams: float
@@ -48,51 +247,28 @@ class RecommendationRequest(BaseModel):
 
 @router.post("/sperm-recommendation")
 def sperm_food_recommendation(request: RecommendationRequest):
-    user = next((u for u in user_profiles if u["user_id"] == request.user_id), None)
+    user = get_profile_store("men").get(request.user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
 
-    # 1. Predict sperm health score
-    diet_encoding = {"unhealthy": 0, "average": 1, "healthy": 2}
-    input_data = np.array([[user["age"],
-                            int(user["smoker"]),
-                            diet_encoding[user["diet"]],
-                            int(user["exercise"]),
-                            user["sleep_hours"],
-                            user["bmi"]]])
-    input_scaled = scaler.transform(input_data)
-    sperm_score = round(model.predict(input_scaled)[0], 2)
-
-    # 2. Calculate nutrient intake
-    intake = {nut: 0 for nut in nutrients}
-    for entry in request.meals:
-        match = food_df[food_df["food_name"].str.lower() == entry.food_name.lower()]
-        if not match.empty:
-            for nut in nutrients:
-                intake[nut] += (match[nut].values[0] * entry.amount_grams / 100)
-
-    # 3. Calculate gaps
-    multiplier = 1.0 if sperm_score >= 80 else 1.2
-    gaps = {
-        nut: max(0, nutrient_targets[nut] * multiplier - intake.get(nut, 0))
-        for nut in nutrients
-    }
-
-    # 4. Recommend foods
-    user_vector = np.array([gaps[nut] for nut in nutrients])
-    if np.linalg.norm(user_vector) == 0:
-        recommendations = food_df.sample(5)[["food_name", "region"]].to_dict(orient="records")
-    else:
-        user_vec_norm = user_vector / np.linalg.norm(user_vector)
-        food_vectors = food_df[nutrients].fillna(0).values
-        food_vectors_norm = food_vectors / np.linalg.norm(food_vectors, axis=1, keepdims=True)
-        food_df["similarity"] = cosine_similarity([user_vec_norm], food_vectors_norm)[0]
-        recommendations = food_df.sort_values(by="similarity", ascending=False)\
-                                 .head(5)[["food_name", "similarity"]].to_dict(orient="records")
-
-    return {
-        "sperm_health_score": sperm_score,
-        "nutrient_intake": intake,
-        "nutrient_gaps": gaps,
-        "recommendations": recommendations
-    }
+    engine = get_sperm_engine()
+    sperm_score = cached_scores(engine, [user])[0]
+    with span("similarity_scoring", router="sperm"):
+        return engine.report(request.meals, sperm_score, user.get("region"))
+
+@router.post("/sperm-recommendation/batch")
+def sperm_food_recommendation_batch(requests: List[RecommendationRequest]):
+    user_profiles = get_profile_store("men")
+    users = {r.user_id: user_profiles.get(r.user_id) for r in requests}
+    found = {uid: user for uid, user in users.items() if user is not None}
+
+    engine = get_sperm_engine()
+    scores = dict(zip(found, cached_scores(engine, list(found.values()))))
+
+    results = []
+    for r in requests:
+        if r.user_id not in scores:
+            results.append({"user_id": r.user_id, "error": "User not found"})
+        else:
+            results.append({"user_id": r.user_id, **engine.report(r.meals, scores[r.user_id], found[r.user_id].get("region"))})
+    return results
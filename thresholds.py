@@ -0,0 +1,118 @@
+import hashlib
+import itertools
+import json
+import os
+import threading
+
+import numpy as np
+
+from metrics import span
+from registry import registry
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+THRESHOLD_PATH = os.path.join(BASE_DIR, "threshold.json")
+
+# Canonical nutrient order of every compiled threshold vector, mapped to the
+# key used for it in threshold.json
+THRESHOLD_KEYS = {
+    "protein": "protein_g",
+    "fat": "fat_g",
+    "carbs": "carbs_g",
+    "iron": "iron_mg",
+    "calcium": "calcium_mg",
+    "vitaminA": "vitamin_a_mcg",
+    "vitaminC": "vitamin_c_mg",
+    "folate": "folic_acid_mcg",
+    "iodine": "iodine_mcg"
+}
+NUTRIENTS = list(THRESHOLD_KEYS)
+
+STAGES = ("planning", "prenatal", "postpartum")
+
+
+# Pre-merges "stage + preconditions" thresholds into read-only NumPy vectors.
+# A user's profile is reduced to a signature (stage, sorted conditions) and
+# every signature for the known stages is compiled up front.
+class ThresholdCompiler:
+    def __init__(self, thresholds, version=None, digest=None):
+        self.version = version
+        # Content hash of threshold.json (see FoodCatalog.digest)
+        self.digest = digest
+        self.nutrients = NUTRIENTS
+        self.nutrient_index = {n: i for i, n in enumerate(NUTRIENTS)}
+
+        self._base = {}
+        for name, values in thresholds.items():
+            vector = np.array([values.get(THRESHOLD_KEYS[n], 0) for n in NUTRIENTS], dtype=np.float64)
+            vector.setflags(write=False)
+            self._base[name.lower()] = vector
+        self.conditions = tuple(sorted(set(self._base) - set(STAGES)))
+
+        self._profiles = {}
+        for stage in STAGES:
+            for r in range(len(self.conditions) + 1):
+                for combo in itertools.combinations(self.conditions, r):
+                    self._profiles[(stage, combo)] = self._merge(stage, combo)
+
+    @classmethod
+    def load(cls, path=THRESHOLD_PATH):
+        stat = os.stat(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        thresholds = json.loads(data.decode("utf-8"))["nutrient_thresholds"]
+        return cls(thresholds, (stat.st_mtime_ns, stat.st_size), hashlib.sha1(data).hexdigest())
+
+    def signature(self, user):
+        present = {
+            condition.lower()
+            for condition, flag in user.get("preconditions", {}).items()
+            if flag
+        }
+        return (str(user.get("stage", "")).lower(), tuple(sorted(present & set(self.conditions))))
+
+    def _merge(self, stage, conditions):
+        zeros = np.zeros(len(NUTRIENTS))
+        vector = self._base.get(stage, zeros)
+        for condition in conditions:
+            vector = np.maximum(vector, self._base.get(condition, zeros))
+        vector = np.array(vector, dtype=np.float64)
+        vector.setflags(write=False)
+        return vector
+
+    def vector(self, signature):
+        # Signatures of unknown stages come from client input: merged per
+        # call, never added to the table
+        vector = self._profiles.get(signature)
+        if vector is None:
+            vector = self._merge(*signature)
+        return vector
+
+    def for_user(self, user):
+        return self.vector(self.signature(user))
+
+    def columns(self, names):
+        return [self.nutrient_index[n] for n in names]
+
+
+_compilers = {}
+_compilers_lock = threading.Lock()
+
+
+def get_threshold_compiler(path=THRESHOLD_PATH):
+    # Shared compiler, rebuilt only when threshold.json changes on disk
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    version = (stat.st_mtime_ns, stat.st_size)
+    compiler = _compilers.get(path)
+    if compiler is not None and compiler.version == version:
+        return compiler
+    with _compilers_lock:
+        compiler = _compilers.get(path)
+        if compiler is None or compiler.version != version:
+            with registry.timing("load", "thresholds"), span("catalog_load", source="thresholds"):
+                compiler = ThresholdCompiler.load(path)
+            _compilers[path] = compiler
+        return compiler
+
+
+registry.add_warmer("thresholds", get_threshold_compiler)
@@ -6,6 +6,8 @@ BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 csv_path = os.path.join(BASE_DIR, "nepalifood.csv")
 
 model = NutrientGapRecommender(csv_path)
+# Fit per-region min-max parameters once so serving never refits a scaler
+model.fit_region_scaling()
 joblib.dump(model, os.path.join(BASE_DIR, "model", "recommender_model.joblib"))
 
 # Save model into model/ folder